@@ -2,7 +2,9 @@ from .login import System
 from .session import Session
 from .groq_API import Key
 from .database import Database
-from .text_extractor import from_pdf, from_docx, from_image
+from .text_extractor import from_pdf, from_docx, from_image, iter_pdf_pages
+from .text_extractor import ParallelExtractor, ExtractionCancelled
+from .pipeline import Pipeline
 
 __all__ = [
     "System",
@@ -11,5 +13,9 @@ __all__ = [
     "Database",
     "from_pdf",
     "from_docx",
-    "from_image"
+    "from_image",
+    "iter_pdf_pages",
+    "ParallelExtractor",
+    "ExtractionCancelled",
+    "Pipeline"
 ]
@@ -1,52 +1,121 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from . import embeddings
 from . import history
+from . import documents
 from .database import Database
 
-def retrieve(question, opened_db: Database = None):
+NEIGHBOR_WINDOW = 0
+FUSION = "min"
+LEXICAL_LIMIT = 5
+VECTOR_WEIGHT = 1.0
+LEXICAL_WEIGHT = 1.0
+RRF_K = 60
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="retrieval")
+logger = logging.getLogger(__name__)
+
+def _vector_rows(question_embeddings, opened_db: Database, fusion: str, document_id: int = None) -> list[tuple]:
+    if len(question_embeddings) == 0:
+        return []
+    if document_id is not None:
+        return documents.search(question_embeddings, opened_db, document_id, LEXICAL_LIMIT, fusion)
+    embeddings_table = opened_db.get_table("embeddings")
+    hits = embeddings_table.search_similar(list(question_embeddings), with_distance=True, fusion=fusion)
+    return opened_db.resolve_hits(hits)
+
+def _fuse(ranked_lists: list[list[tuple]], weights: list[float]) -> list[tuple]:
+    """
+    Weighted reciprocal rank fusion of (chunk id, content, ...) rows
+    Returns: (chunk id, content, score) rows, highest score first
+    """
+    scores = {}
+    rows = {}
+    for ranked, weight in zip(ranked_lists, weights):
+        if weight <= 0:
+            continue
+        for rank, (chunk_id, content, *_) in enumerate(ranked):
+            # Messages saved before chunks were stored have no chunk id.
+            key = chunk_id if chunk_id is not None else ("message", content)
+            scores[key] = scores.get(key, 0.0) + weight / (RRF_K + rank + 1)
+            rows.setdefault(key, (chunk_id, content))
+    ranked_keys = sorted(scores, key=lambda key: scores[key], reverse=True)
+    return [(*rows[key], scores[key]) for key in ranked_keys]
+
+def retrieve_ranked(
+    question,
+    opened_db: Database = None,
+    window: int = NEIGHBOR_WINDOW,
+    fusion: str = FUSION,
+    vector_weight: float = VECTOR_WEIGHT,
+    lexical_weight: float = LEXICAL_WEIGHT,
+    document_id: int = None
+) -> list[tuple]:
+    """
+    Hybrid retrieval: vector search and BM25 over the stored chunks, fused with reciprocal rank fusion
+    document_id: limit both searches to the chunks of one indexed document
+    Returns: (content, score) pairs, most relevant first; a weight of 0 disables that search
+    """
     if not opened_db:
-        return ""
-    
-    context_parts = []
+        return []
     
     try:
-        question_embeddings = embeddings.generate(question)
-        if not question_embeddings:
-            return ""
-        
-        embeddings_table = opened_db.get_table("embeddings")
-        if not embeddings_table:
-            return ""
+        # The question is embedded on a worker thread while the lexical search
+        # runs here; SQLite stays on this thread, so the worker skips the
+        # database layer of the embedding cache.
+        pending_embeddings = None
+        if vector_weight > 0:
+            pending_embeddings = _executor.submit(lambda: embeddings.generate_many([question])[0])
         
-        retrieved_results = embeddings_table.search_similar([question_embeddings])
-        if not retrieved_results:
-            return ""
+        lexical_rows = []
+        if lexical_weight > 0:
+            source = documents.SOURCE if document_id is not None else None
+            lexical_rows = opened_db.search_text(question, LEXICAL_LIMIT, source, document_id)
+        vector_rows = []
+        if pending_embeddings:
+            vector_rows = _vector_rows(pending_embeddings.result(), opened_db, fusion, document_id)
         
-        embeddings_message_table = opened_db.get_table("embeddings_message")
-        history_table = opened_db.get_table("history")
-        
-        if not embeddings_message_table or not history_table:
-            return ""
-        
-        messages_ids = []
-        for result in retrieved_results:
-            rows = embeddings_message_table.select(
-                ["message_id"], 
-                "embedding_rowid == ?", 
-                [result]
+        rows = _fuse([vector_rows, lexical_rows], [vector_weight, lexical_weight])
+        if window > 0:
+            neighbors = opened_db.neighbor_chunks(
+                [chunk_id for chunk_id, _, _ in rows if chunk_id is not None],
+                window
             )
-            if rows:
-                messages_ids.append(rows[0][0])
+            rows = [
+                (chunk_id, embeddings.merge_spans(neighbors[chunk_id]) if chunk_id in neighbors else content, score)
+                for chunk_id, content, score in rows
+            ]
         
-        for message_id in messages_ids:
-            rows = history_table.select(
-                ["content"], 
-                "id = ?", 
-                [message_id]
-            )
-            if rows:
-                context_parts.append(rows[0][0])
+        return [(content, score) for _, content, score in rows]
     
     except Exception:
-        return ""
-    
+        logger.exception("Retrieval failed")
+        return []
+
+def retrieve(
+    question,
+    opened_db: Database = None,
+    window: int = NEIGHBOR_WINDOW,
+    fusion: str = FUSION,
+    vector_weight: float = VECTOR_WEIGHT,
+    lexical_weight: float = LEXICAL_WEIGHT,
+    document_id: int = None
+):
+    context_parts = [
+        content
+        for content, _ in retrieve_ranked(question, opened_db, window, fusion, vector_weight, lexical_weight, document_id)
+    ]
     return "\n\n".join(context_parts)
+
+def merge_ranked(*ranked_lists: list[tuple]) -> list[tuple]:
+    """
+    Concatenate (content, score) lists, keeping the first copy of each content
+    """
+    seen = set()
+    merged = []
+    for ranked in ranked_lists:
+        for content, score in ranked:
+            if content not in seen:
+                seen.add(content)
+                merged.append((content, score))
+    return merged
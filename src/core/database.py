@@ -1,22 +1,65 @@
 import pysqlite3 as sqlite3
-import sqlite_vss
 import numpy as np
+import math
 import os
+import re
+import json
+import tempfile
+from contextlib import contextmanager
+from .vector_store import VectorStore, NumpyStore
+from .hnsw import HnswStore
+from .quantization import QuantizedStore
+
+try:
+    import sqlite_vss
+except ImportError:
+    sqlite_vss = None
 
 class SQL_general_commands:
     def __init__(self):
         self.create_table = "CREATE TABLE IF NOT EXISTS {name}({attributes})"
         self.insert_record = "INSERT INTO {name} {columns} VALUES ({placeholders})"
         self.select_fields = "SELECT {fields} FROM {name} WHERE {condition}"
+        self.update_record = "UPDATE {name} SET {assignments} WHERE {condition}"
         self.delete_record = "DELETE FROM {table} WHERE {condition}"
         self.delete_table = "DROP TABLE IF EXISTS {name}"
+        self.create_index = "CREATE INDEX IF NOT EXISTS {index} ON {name}({columns})"
+        self.create_text_index = "CREATE VIRTUAL TABLE IF NOT EXISTS {name}_fts USING fts5({column}, content='{name}', content_rowid='{key}')"
+        self.create_text_index_triggers = [
+            """CREATE TRIGGER IF NOT EXISTS {name}_fts_insert AFTER INSERT ON {name} BEGIN
+                INSERT INTO {name}_fts (rowid, {column}) VALUES (new.{key}, new.{column});
+            END""",
+            """CREATE TRIGGER IF NOT EXISTS {name}_fts_delete AFTER DELETE ON {name} BEGIN
+                INSERT INTO {name}_fts ({name}_fts, rowid, {column}) VALUES ('delete', old.{key}, old.{column});
+            END""",
+            """CREATE TRIGGER IF NOT EXISTS {name}_fts_update AFTER UPDATE ON {name} BEGIN
+                INSERT INTO {name}_fts ({name}_fts, rowid, {column}) VALUES ('delete', old.{key}, old.{column});
+                INSERT INTO {name}_fts (rowid, {column}) VALUES (new.{key}, new.{column});
+            END"""
+        ]
+        self.rebuild_text_index = "INSERT INTO {name}_fts ({name}_fts) VALUES ('rebuild')"
+        self.table_exists = "SELECT 1 FROM sqlite_master WHERE name = ?"
     
 
 class SQL_VIRTUAL_TABLE_commands(SQL_general_commands):
     def __init__(self):
         super().__init__()
         self.create_table = "CREATE VIRTUAL TABLE IF NOT EXISTS {name} USING vss0({attributes})"
-        self.insert_record = "INSERT INTO {name} (rowid, {columns}) VALUES ((SELECT IFNULL(MAX(rowid), 0) + 1 FROM {name}), {placeholders})"
+        self.insert_record = "INSERT INTO {name} (rowid, {columns}) VALUES (?, {placeholders})"
+        self.seed_rowid_sequence = "INSERT OR IGNORE INTO rowid_sequence (name, next_rowid) VALUES (?, ?)"
+        self.max_rowid = "SELECT IFNULL(MAX(rowid), 0) FROM {name}"
+        self.select_vectors = "SELECT rowid, {column} FROM {name}"
+        self.train_record = "INSERT INTO {name} (operation, {column}) VALUES ('training', ?)"
+        self.select_vector_index = "SELECT backend, factory, options FROM vector_index WHERE name = ?"
+        self.save_vector_index = """
+            INSERT INTO vector_index (name, backend, factory, options) VALUES (?, ?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET
+                backend = excluded.backend,
+                factory = excluded.factory,
+                options = excluded.options,
+                updated_at = CURRENT_TIMESTAMP
+        """
+        self.allocate_rowids = "UPDATE rowid_sequence SET next_rowid = next_rowid + ? WHERE name = ? RETURNING next_rowid"
         self.search = "SELECT {fields} FROM {name} WHERE vss_search({vector_column}, ?)"
         self.search_with_distance = """
             SELECT {fields}, distance 
@@ -24,6 +67,44 @@ class SQL_VIRTUAL_TABLE_commands(SQL_general_commands):
             WHERE vss_search({vector_column}, ?)
             ORDER BY distance ASC
         """
+        self.search_batch_part = """
+            SELECT * FROM (
+                SELECT {fields}, distance, {query} AS query
+                FROM {name}
+                WHERE vss_search({vector_column}, ?)
+                ORDER BY distance ASC
+                LIMIT {limit}
+            )
+        """
+        self.resolve_hits = """
+            WITH hits(rowid, distance, rank) AS (VALUES {hits})
+            SELECT chunks.id, COALESCE(chunks.content, history.content) AS content, MIN(hits.distance) AS distance
+            FROM hits
+            LEFT JOIN chunks ON chunks.embedding_rowid = hits.rowid
+            LEFT JOIN embeddings_message ON chunks.id IS NULL AND embeddings_message.embedding_rowid = hits.rowid
+            LEFT JOIN history ON history.id = embeddings_message.message_id
+            WHERE COALESCE(chunks.content, history.content) IS NOT NULL
+            GROUP BY COALESCE('chunk:' || chunks.id, 'message:' || history.id)
+            ORDER BY MIN(hits.rank) ASC
+        """
+        self.search_text = """
+            SELECT chunks.id, chunks.content, bm25(chunks_fts) AS score
+            FROM chunks_fts
+            JOIN chunks ON chunks.id = chunks_fts.rowid
+            WHERE chunks_fts MATCH ? {condition}
+            ORDER BY score ASC
+            LIMIT ?
+        """
+        self.neighbor_chunks = """
+            SELECT hit.id, neighbor.start_token, neighbor.end_token, neighbor.content
+            FROM chunks AS hit
+            JOIN chunks AS neighbor
+                ON neighbor.source = hit.source
+                AND neighbor.source_id = hit.source_id
+                AND neighbor.position BETWEEN hit.position - ? AND hit.position + ?
+            WHERE hit.id IN ({ids})
+            ORDER BY hit.id, neighbor.position
+        """
     
 
 class Table:
@@ -33,6 +114,18 @@ class Table:
         self.db_path = db_path
         self.db_cursor = db_cursor
         self.commands = SQL_general_commands()
+        self.defer_commit = False
+    
+    def _commit(self):
+        if not self.defer_commit:
+            self.db_cursor.connection.commit()
+            self.after_commit()
+    
+    def after_commit(self):
+        pass
+    
+    def after_rollback(self):
+        pass
     
     def create_if_not_exist(self) -> bool:
         try:
@@ -41,11 +134,45 @@ class Table:
                 attributes = ", ".join(self.attributes)
             )
             self.db_cursor.execute(command)
-            self.db_cursor.connection.commit()
+            self._commit()
             return True
         except sqlite3.Error as e:
             return False
     
+    def create_index(self, columns: list[str]) -> bool:
+        try:
+            command = self.commands.create_index.format(
+                index = f"idx_{self.name}_{'_'.join(columns)}",
+                name = self.name,
+                columns = ", ".join(columns)
+            )
+            self.db_cursor.execute(command)
+            self._commit()
+            return True
+        except sqlite3.Error:
+            if self.defer_commit:
+                raise
+            return False
+    
+    def create_text_index(self, column: str, key: str = "id") -> bool:
+        """
+        Keep an FTS5 index of column in {name}_fts, synced by triggers;
+        rows that predate the index are indexed when it is first created
+        """
+        try:
+            exists = self.db_cursor.execute(self.commands.table_exists, [f"{self.name}_fts"]).fetchone()
+            self.db_cursor.execute(self.commands.create_text_index.format(name = self.name, column = column, key = key))
+            for trigger in self.commands.create_text_index_triggers:
+                self.db_cursor.execute(trigger.format(name = self.name, column = column, key = key))
+            if not exists:
+                self.db_cursor.execute(self.commands.rebuild_text_index.format(name = self.name))
+            self._commit()
+            return True
+        except sqlite3.Error:
+            if self.defer_commit:
+                raise
+            return False
+    
     def insert(self, record: list, columns: list[str] = None):
         try:
             placeholders = ", ".join(["?" for _ in record])
@@ -55,10 +182,59 @@ class Table:
                 placeholders = placeholders
             )
             self.db_cursor.execute(command, record)
-            self.db_cursor.connection.commit()
+            self._commit()
         except sqlite3.Error:
             pass
     
+    def insert_many(self, records: list[list], columns: list[str] = None) -> list[int]:
+        if not records:
+            return []
+        try:
+            placeholders = ", ".join(["?" for _ in records[0]])
+            command = self.commands.insert_record.format(
+                name = self.name,
+                columns = '('+", ".join(columns)+')' if columns else "",
+                placeholders = placeholders
+            )
+            self.db_cursor.executemany(command, records)
+            # Rowids are contiguous: the batch runs in one statement while this
+            # connection holds the write lock.
+            last_rowid = self.db_cursor.execute("SELECT last_insert_rowid()").fetchone()[0]
+            self._commit()
+            return list(range(last_rowid - len(records) + 1, last_rowid + 1))
+        except sqlite3.Error:
+            # Inside a transaction the caller must see the failure, so the
+            # whole transaction is rolled back instead of committed.
+            if self.defer_commit:
+                raise
+            return []
+    
+    def update(self, fields: dict, condition: str, values: list = None) -> bool:
+        try:
+            command = self.commands.update_record.format(
+                name = self.name,
+                assignments = ", ".join(f"{field} = ?" for field in fields),
+                condition = condition
+            )
+            self.db_cursor.execute(command, [*fields.values(), *(values or ())])
+            self._commit()
+            return True
+        except sqlite3.Error:
+            if self.defer_commit:
+                raise
+            return False
+    
+    def delete_where(self, condition: str, values: list = None) -> bool:
+        try:
+            command = self.commands.delete_record.format(table = self.name, condition = condition)
+            self.db_cursor.execute(command, values or ())
+            self._commit()
+            return True
+        except sqlite3.Error:
+            if self.defer_commit:
+                raise
+            return False
+    
     def select(self, fields: list[str] = None, condition: str = "", values: list = None):
         try:
             fields_str = ", ".join(fields) if fields else "*"
@@ -75,54 +251,264 @@ class Table:
         try:
             command = self.commands.delete_table.format(name = self.name)
             self.db_cursor.execute(command)
-            self.db_cursor.connection.commit()
+            self._commit()
         except sqlite3.Error:
             pass
     
 
 class Virtual_Table(Table):
-    def __init__(self, name, attributes:list[str], db_path, db_cursor):
+    def __init__(self, name, attributes:list[str], db_path, db_cursor, store: VectorStore = None):
         super().__init__(name, attributes, db_path, db_cursor)
         self.commands = SQL_VIRTUAL_TABLE_commands()
+        self.store = store or VssStore(self)
+    
+    def create_if_not_exist(self) -> bool:
+        return self.store.open()
+    
+    def after_commit(self):
+        self.store.commit()
+    
+    def after_rollback(self):
+        self.store.rollback()
+    
+    def seed_rowid_sequence(self):
+        self.db_cursor.execute(self.commands.seed_rowid_sequence, [self.name, self.store.max_rowid() + 1])
+        self._commit()
+    
+    def allocate_rowids(self, count: int) -> list[int]:
+        row = self.db_cursor.execute(self.commands.allocate_rowids, [count, self.name]).fetchone()
+        if row is None:
+            self.seed_rowid_sequence()
+            row = self.db_cursor.execute(self.commands.allocate_rowids, [count, self.name]).fetchone()
+        self._commit()
+        next_rowid = row[0]
+        return list(range(next_rowid - count, next_rowid))
     
     def insert(self, record: list, columns: list[str] = None):
         try:
             if len(record) == 1:
-                vector = record[0]
-                if hasattr(vector, 'tobytes'):
-                    vector_bytes = vector.tobytes()
-                else:
-                    vector_bytes = vector
-                placeholders = ", ".join(["?" for _ in record])
-                command = self.commands.insert_record.format(
-                    name = self.name,
-                    columns = '('+", ".join(columns)+')' if columns else self.attributes[0].split('(')[0],
-                    placeholders = placeholders
-                )
-                self.db_cursor.execute(command, [vector_bytes])
-                self.db_cursor.connection.commit()
+                rowid = self.allocate_rowids(1)[0]
+                self.store.add([rowid], [record[0]])
+                self._commit()
+                return rowid
         except Exception:
             pass
     
-    def search_similar(self, query_vectors: list, fields: list = ["rowid"], column: str = "embedding", limit_per_vector: int = 3):
+    def insert_many(self, vectors: list, columns: list[str] = None) -> list[int]:
+        if len(vectors) == 0:
+            return []
         try:
-            all_results = []
-            for i, vector in enumerate(query_vectors):
-                vector_bytes = vector.astype(np.float32).tobytes()
-                fields_str = ", ".join(fields) if fields else "*"
-                command = self.commands.search_with_distance.format(
-                    fields = fields_str,
-                    name = self.name,
-                    vector_column = column
-                ) + f" LIMIT {limit_per_vector}"
-                self.db_cursor.execute(command, [vector_bytes])
-                results = self.db_cursor.fetchall()
-                all_results.extend(results)
-            sorted_results = sorted(all_results, key=lambda x: x[-1])[:limit_per_vector * len(query_vectors)]
-            return [item[0] for item in sorted_results]
-        except sqlite3.Error:
+            rowids = self.allocate_rowids(len(vectors))
+            self.store.add(rowids, vectors)
+            self._commit()
+            return rowids
+        except Exception:
+            if self.defer_commit:
+                raise
             return []
     
+    def delete_many(self, rowids: list[int]) -> bool:
+        if len(rowids) == 0:
+            return True
+        try:
+            self.store.remove(list(rowids))
+            self._commit()
+            return True
+        except Exception:
+            if self.defer_commit:
+                raise
+            return False
+    
+    def search_similar(self, query_vectors: list, limit_per_vector: int = 3, with_distance: bool = False, fusion: str = "min"):
+        if len(query_vectors) == 0:
+            return []
+        try:
+            results_per_query = self.store.search(query_vectors, limit_per_vector)
+            fused = fuse_results(results_per_query, fusion)[:limit_per_vector * len(query_vectors)]
+            if with_distance:
+                return fused
+            return [item[0] for item in fused]
+        except (sqlite3.Error, ValueError):
+            return []
+    
+    def close(self):
+        self.store.close()
+    
+
+class VssStore(VectorStore):
+    """
+    Vectors kept in the table itself, a sqlite_vss vss0 virtual table
+    factory: Faiss index factory string, e.g. "IVF4096,Flat,IDMap2"; None for vss0's flat default
+    """
+    def __init__(self, table: Virtual_Table, factory: str = None):
+        self.table = table
+        self.column = table.attributes[0].split('(')[0]
+        self.dimension = int(table.attributes[0].split('(')[1].rstrip(')'))
+        self.factory = factory
+    
+    def open(self) -> bool:
+        try:
+            attributes = self.table.attributes[0]
+            if self.factory:
+                attributes += f' factory="{self.factory}"'
+            command = self.table.commands.create_table.format(name = self.table.name, attributes = attributes)
+            self.table.db_cursor.execute(command)
+            self.table._commit()
+            return True
+        except sqlite3.Error:
+            return False
+    
+    def export(self, batch_size: int = 10000):
+        """
+        Yield the stored (rowids, vectors) in batches
+        """
+        cursor = self.table.db_cursor.connection.cursor()
+        cursor.execute(self.table.commands.select_vectors.format(column = self.column, name = self.table.name))
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            rowids = np.array([rowid for rowid, _ in rows], dtype=np.int64)
+            vectors = np.array([
+                np.frombuffer(vector, dtype=np.float32) if isinstance(vector, bytes) else json.loads(vector)
+                for _, vector in rows
+            ], dtype=np.float32)
+            yield rowids, vectors
+    
+    def stage(self, directory: str, batch_size: int = 10000, progress = None):
+        """
+        Copy every stored vector into a memory-mapped .npy file in directory
+        Returns: (rowids, vectors) arrays
+        """
+        total = self.count()
+        vectors = np.lib.format.open_memmap(
+            os.path.join(directory, f"{self.table.name}.npy"), mode="w+", dtype=np.float32, shape=(total, self.dimension)
+        )
+        rowids = np.empty(total, dtype=np.int64)
+        done = 0
+        for batch_rowids, batch_vectors in self.export(batch_size):
+            count = min(len(batch_rowids), total - done)
+            rowids[done:done + count] = batch_rowids[:count]
+            vectors[done:done + count] = batch_vectors[:count]
+            done += count
+            if progress:
+                progress("export", done, total)
+        return rowids[:done], vectors[:done]
+    
+    def recreate(self, factory: str = None, training_vectors = None):
+        """
+        Drop and recreate the vss0 table with a new index factory, queueing
+        training_vectors for the index; vss0 trains when the transaction commits
+        """
+        self.table.delete_if_exist()
+        self.factory = factory
+        if not self.open():
+            raise sqlite3.Error(f"Could not create {self.table.name} with factory {factory}")
+        if training_vectors is not None and len(training_vectors):
+            command = self.table.commands.train_record.format(name = self.table.name, column = self.column)
+            self.table.db_cursor.executemany(command, [(vector.tobytes(),) for vector in training_vectors])
+    
+    def add_batches(self, rowids, vectors, batch_size: int = 10000, progress = None):
+        total = len(rowids)
+        for start in range(0, total, batch_size):
+            end = min(start + batch_size, total)
+            self.add(rowids[start:end].tolist(), vectors[start:end])
+            if progress:
+                progress("insert", end, total)
+    
+    def max_rowid(self) -> int:
+        command = self.table.commands.max_rowid.format(name = self.table.name)
+        return self.table.db_cursor.execute(command).fetchone()[0]
+    
+    def count(self) -> int:
+        return self.table.db_cursor.execute(f"SELECT COUNT(*) FROM {self.table.name}").fetchone()[0]
+    
+    def remove(self, rowids: list[int], batch_size: int = 500):
+        for start in range(0, len(rowids), batch_size):
+            batch = list(rowids[start:start + batch_size])
+            placeholders = ", ".join("?" for _ in batch)
+            self.table.db_cursor.execute(f"DELETE FROM {self.table.name} WHERE rowid IN ({placeholders})", batch)
+    
+    def get(self, rowids: list[int], batch_size: int = 500) -> np.ndarray:
+        found = {}
+        command = self.table.commands.select_vectors.format(column = self.column, name = self.table.name)
+        for start in range(0, len(rowids), batch_size):
+            batch = list(rowids[start:start + batch_size])
+            placeholders = ", ".join("?" for _ in batch)
+            for rowid, vector in self.table.db_cursor.execute(f"{command} WHERE rowid IN ({placeholders})", batch).fetchall():
+                found[rowid] = np.frombuffer(vector, dtype=np.float32) if isinstance(vector, bytes) else json.loads(vector)
+        return np.array([found[rowid] for rowid in rowids], dtype=np.float32).reshape(len(rowids), self.dimension)
+    
+    def add(self, rowids: list[int], vectors: list):
+        command = self.table.commands.insert_record.format(
+            name = self.table.name,
+            columns = self.column,
+            placeholders = "?"
+        )
+        records = [
+            (rowid, vector.tobytes() if hasattr(vector, 'tobytes') else vector)
+            for rowid, vector in zip(rowids, vectors)
+        ]
+        self.table.db_cursor.executemany(command, records)
+    
+    def search(self, query_vectors: list, k: int) -> list[list[tuple]]:
+        # Every query vector runs in one statement; each part keeps its
+        # own LIMIT so vss0 still answers it as a top-k search.
+        command = " UNION ALL ".join(
+            self.table.commands.search_batch_part.format(
+                fields = "rowid",
+                query = i,
+                name = self.table.name,
+                vector_column = self.column,
+                limit = k
+            )
+            for i in range(len(query_vectors))
+        )
+        vectors_bytes = [np.asarray(vector, dtype=np.float32).tobytes() for vector in query_vectors]
+        self.table.db_cursor.execute(command, vectors_bytes)
+        
+        results_per_query = [[] for _ in query_vectors]
+        for rowid, distance, query in self.table.db_cursor.fetchall():
+            results_per_query[query].append((rowid, distance))
+        return results_per_query
+    
+
+def fuse_results(results_per_query: list[list[tuple]], strategy: str = "min", rrf_k: int = 60) -> list[tuple]:
+    """
+    Merge per-query (key, distance) lists into one list deduplicated by key
+    strategy: "min" or "mean" distance across queries, or "rrf" (reciprocal rank fusion)
+    Returns: (key, distance) pairs, best first; distance is the min, or the mean for "mean"
+    """
+    distances = {}
+    rrf_scores = {}
+    for results in results_per_query:
+        for rank, (key, distance) in enumerate(sorted(results, key=lambda x: x[1])):
+            distances.setdefault(key, []).append(distance)
+            rrf_scores[key] = rrf_scores.get(key, 0.0) + 1.0 / (rrf_k + rank + 1)
+    
+    if strategy == "mean":
+        fused = [(key, sum(values) / len(values)) for key, values in distances.items()]
+        return sorted(fused, key=lambda x: x[1])
+    if strategy == "rrf":
+        ranked = sorted(distances, key=lambda key: (-rrf_scores[key], min(distances[key])))
+        return [(key, min(distances[key])) for key in ranked]
+    if strategy == "min":
+        fused = [(key, min(values)) for key, values in distances.items()]
+        return sorted(fused, key=lambda x: x[1])
+    raise ValueError(f"Unknown fusion strategy '{strategy}'")
+    
+
+# Where each backend keeps its vectors; backends sharing a storage can read
+# each other's vectors.
+VECTOR_STORAGE = {
+    "numpy": "float32",
+    "hnsw": "float32",
+    "int8": "float32",
+    "binary": "float32",
+    "numpy16": "float16",
+    "vss": "vss"
+}
+
 
 class NonSavedDatabaseError(Exception):
     pass
@@ -132,27 +518,73 @@ class NonOpenedDatabaseError(Exception):
     pass
     
 
+class VectorBackendMismatchError(Exception):
+    pass
+    
+
 class Database:
-    def __init__(self, path: str = ""):
+    def __init__(self, path: str = "", vector_backend: str = None, vector_options: dict = None):
         self.path = ""
         self.name = os.path.splitext(os.path.basename(self.path))[0]
         self.tables: list['Table'] = []
         self.conn = None
         self.on_created = None
         self.on_opened = None
+        self._transaction_depth = 0
+        # "vss" keeps vectors in a sqlite_vss table, "numpy" in a .npy sidecar
+        # file next to the database; "hnsw" adds a graph index over that
+        # sidecar and "int8" / "binary" scan quantized codes of it before
+        # reranking with the full vectors. When not given, the backend recorded in the database is
+        # reused, else vss if the extension is installed. initiate() raises
+        # VectorBackendMismatchError rather than switch away from a backend that
+        # already holds vectors in another storage, or open a vss database
+        # without the extension.
+        self._requested_backend = vector_backend
+        self.vector_backend = vector_backend
+        # Backend settings, e.g. {"m": 16, "ef_construction": 200, "ef_search": 64} for hnsw
+        self._requested_options = vector_options
+        self.vector_options = vector_options or {}
+        self._vss_loaded = False
     
     def initiate(self, path: str):
         try:
             if not self.conn:
-                self.conn = sqlite3.connect(path)
-                self.conn.enable_load_extension(True)
-                sqlite_vss.load(self.conn)
+                # Requests run on a worker thread; the app hands the connection
+                # to one thread at a time, so the same-thread check is relaxed.
+                self.conn = sqlite3.connect(path, check_same_thread=False)
                 self.conn.execute("PRAGMA foreign_keys = ON;")
                 self.cursor = self.conn.cursor()
             
             self.path = path
             self.name = os.path.splitext(os.path.basename(self.path))[0]
             self.tables = []
+            
+            vector_index_attributes = [
+                "name TEXT PRIMARY KEY",
+                "backend TEXT",
+                "factory TEXT",
+                "options TEXT",
+                "updated_at DATETIME DEFAULT CURRENT_TIMESTAMP"
+            ]
+            vector_index = Table("vector_index", vector_index_attributes, path, self.cursor)
+            vector_index.create_if_not_exist()
+            index_config = self.get_vector_index_config("embeddings")
+            recorded_backend = index_config.get("backend") or self._legacy_vector_backend()
+            self.vector_backend = self._requested_backend or recorded_backend or ("vss" if sqlite_vss else "numpy")
+            self._check_backend_switch(recorded_backend)
+            if self._requested_options is not None:
+                self.vector_options = self._requested_options
+            else:
+                self.vector_options = index_config.get("options") or {}
+            factory = index_config.get("factory") if index_config.get("backend") == self.vector_backend else None
+            if self.vector_backend == "vss" and not self._vss_loaded:
+                if not sqlite_vss:
+                    # Never fall back to another backend: the stored vectors
+                    # would be orphaned and the record rewritten.
+                    raise VectorBackendMismatchError(f"{self.path} uses the 'vss' backend, which needs the sqlite_vss extension")
+                self.conn.enable_load_extension(True)
+                sqlite_vss.load(self.conn)
+                self._vss_loaded = True
             history_attributes = [
                 "id INTEGER PRIMARY KEY AUTOINCREMENT",
                 "role TEXT",
@@ -165,19 +597,196 @@ class Database:
                 "message_id INTEGER", 
                 "FOREIGN KEY(message_id) REFERENCES history(id)"
             ]
+            embedding_cache_attributes = [
+                "key TEXT PRIMARY KEY",
+                "embedding BLOB"
+            ]
+            chunks_attributes = [
+                "id INTEGER PRIMARY KEY AUTOINCREMENT",
+                "source TEXT",
+                "source_id INTEGER",
+                "position INTEGER",
+                "start_token INTEGER",
+                "end_token INTEGER",
+                "content TEXT",
+                "embedding_rowid INTEGER"
+            ]
+            documents_attributes = [
+                "id INTEGER PRIMARY KEY AUTOINCREMENT",
+                "sha256 TEXT UNIQUE",
+                "name TEXT",
+                "chunk_count INTEGER",
+                "created_at DATETIME DEFAULT CURRENT_TIMESTAMP"
+            ]
+            files_attributes = [
+                "path TEXT PRIMARY KEY",
+                "mtime REAL",
+                "size INTEGER",
+                "sha256 TEXT",
+                "document_id INTEGER",
+                "ingested_at DATETIME DEFAULT CURRENT_TIMESTAMP"
+            ]
+            rowid_sequence_attributes = [
+                "name TEXT PRIMARY KEY",
+                "next_rowid INTEGER NOT NULL"
+            ]
             history = Table("history", history_attributes, path, self.cursor)
-            embeddings = Virtual_Table("embeddings", embeddings_attributes, path, self.cursor)
+            embeddings = Virtual_Table(
+                "embeddings",
+                embeddings_attributes,
+                path,
+                self.cursor,
+                self._make_vector_store("embeddings", 384, path)
+            )
+            if self.vector_backend == "vss":
+                embeddings.store = VssStore(embeddings, factory)
             embeddings_message = Table("embeddings_message", embeddings_message_attributes, path, self.cursor)
+            embedding_cache = Table("embedding_cache", embedding_cache_attributes, path, self.cursor)
+            rowid_sequence = Table("rowid_sequence", rowid_sequence_attributes, path, self.cursor)
+            chunks = Table("chunks", chunks_attributes, path, self.cursor)
+            documents = Table("documents", documents_attributes, path, self.cursor)
+            files = Table("files", files_attributes, path, self.cursor)
             
-            self.tables.extend([history, embeddings, embeddings_message])
+            self.tables.extend([history, embeddings, embeddings_message, embedding_cache, rowid_sequence, chunks, documents, files, vector_index])
         
             self.get_table("history").create_if_not_exist()
-            self.get_table("embeddings").create_if_not_exist()
+            if not self.get_table("embeddings").create_if_not_exist():
+                return False
             self.get_table("embeddings_message").create_if_not_exist()
+            self.get_table("embedding_cache").create_if_not_exist()
+            self.get_table("rowid_sequence").create_if_not_exist()
+            self.get_table("embeddings_message").create_index(["embedding_rowid"])
+            self.get_table("embeddings_message").create_index(["message_id"])
+            self.get_table("chunks").create_if_not_exist()
+            self.get_table("chunks").create_index(["embedding_rowid"])
+            self.get_table("chunks").create_index(["source", "source_id", "position"])
+            self.get_table("chunks").create_text_index("content")
+            self.get_table("documents").create_if_not_exist()
+            self.get_table("files").create_if_not_exist()
+            # Seeded once from the existing rows; inserts then draw ids from
+            # the sequence instead of scanning the virtual table.
+            self.get_table("embeddings").seed_rowid_sequence()
+            self._save_vector_index_config("embeddings", factory)
             return True
         except sqlite3.Error:
             return False
     
+    def _legacy_vector_backend(self):
+        """
+        Returns: "vss" for a database written before backends were recorded, else None
+        """
+        row = self.cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'embeddings'").fetchone()
+        return "vss" if row else None
+    
+    def _has_vectors(self) -> bool:
+        # Every stored vector is referenced by a chunk or a history link.
+        for table in ("chunks", "embeddings_message"):
+            if self.cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", [table]).fetchone():
+                if self.cursor.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone():
+                    return True
+        return False
+    
+    def _check_backend_switch(self, recorded_backend: str):
+        """
+        Refuse to open a database with a backend that cannot read the vectors
+        it already holds; they would be orphaned and the record overwritten
+        Backends sharing the float32 sidecar only differ by the index they
+        build from it on open, so switching between them is allowed.
+        """
+        requested = self._requested_backend
+        if not requested or not recorded_backend or requested == recorded_backend:
+            return
+        if VECTOR_STORAGE.get(requested, requested) == VECTOR_STORAGE.get(recorded_backend, recorded_backend):
+            return
+        if self._has_vectors():
+            raise VectorBackendMismatchError(
+                f"{self.path} keeps its vectors in the '{recorded_backend}' backend, not '{requested}'"
+            )
+    
+    def get_vector_index_config(self, name: str) -> dict:
+        """
+        Get the recorded vector backend, vss factory and backend options of a vector table
+        Returns: dictionary with backend, factory and options, empty if nothing is recorded
+        """
+        try:
+            command = SQL_VIRTUAL_TABLE_commands().select_vector_index
+            row = self.cursor.execute(command, [name]).fetchone()
+            if not row:
+                return {}
+            backend, factory, options = row
+            return {"backend": backend, "factory": factory, "options": json.loads(options) if options else {}}
+        except (sqlite3.Error, ValueError):
+            return {}
+    
+    def _save_vector_index_config(self, name: str, factory: str = None):
+        command = SQL_VIRTUAL_TABLE_commands().save_vector_index
+        self.cursor.execute(command, [name, self.vector_backend, factory, json.dumps(self.vector_options)])
+        self.get_table("vector_index")._commit()
+    
+    def rebuild_vector_index(self, factory: str = None, train_sample: int = 100000, progress = None, name: str = "embeddings"):
+        """
+        Train a Faiss index on a random sample of the stored vectors and
+        rebuild the vss0 table with it, recording the factory for later opens
+        factory: Faiss index factory string; by default an IVF index with about
+        4 * sqrt(n) lists, "IVF{lists},Flat,IDMap2"
+        progress: optional callback(stage, done, total), stage in "export", "train", "insert"
+        Vectors are read back from the current index, so an index that cannot
+        reconstruct them (IVF without a direct map) fails before anything changes.
+        If training or inserting fails, the vectors are put back under the
+        previous factory.
+        """
+        table = self.get_table(name)
+        store = table.store
+        if not isinstance(store, VssStore):
+            raise ValueError(f"Index factories need the vss backend, not '{self.vector_backend}'")
+        
+        previous_factory = store.factory
+        with tempfile.TemporaryDirectory() as directory:
+            # Vectors are staged in a memory-mapped file so memory stays flat.
+            rowids, vectors = store.stage(directory, progress = progress)
+            total = len(rowids)
+            if total == 0:
+                raise ValueError(f"{name} holds no vectors to train an index on")
+            sample_size = min(train_sample, total)
+            factory = factory or f"IVF{max(1, int(4 * math.sqrt(total)))},Flat,IDMap2"
+            lists = re.search(r"IVF(\d+)", factory)
+            if lists and sample_size < int(lists.group(1)):
+                raise ValueError(
+                    f"{factory} needs at least {lists.group(1)} training vectors, "
+                    f"only {sample_size} are available; use fewer IVF lists"
+                )
+            sample = np.sort(np.random.default_rng().choice(total, sample_size, replace=False))
+            
+            try:
+                self._fill_vector_index(store, factory, rowids, vectors, sample, progress)
+                self._save_vector_index_config(name, factory)
+            except Exception:
+                # The table may already be replaced: put the vectors back under the previous index.
+                self._fill_vector_index(store, previous_factory, rowids, vectors, sample)
+                raise
+    
+    def _fill_vector_index(self, store: 'VssStore', factory: str, rowids, vectors, sample, progress = None):
+        # vss0 only trains on commit, so training and inserting cannot
+        # share a transaction.
+        with self.transaction():
+            store.recreate(factory, vectors[sample] if factory else None)
+        if progress:
+            progress("train", len(sample), len(rowids))
+        with self.transaction():
+            store.add_batches(rowids, vectors, progress = progress)
+    
+    def _make_vector_store(self, name: str, dimension: int, path: str) -> VectorStore:
+        if self.vector_backend == "numpy":
+            return NumpyStore(path, name, dimension, **self.vector_options)
+        if self.vector_backend == "numpy16":
+            return NumpyStore(path, name, dimension, np.float16)
+        if self.vector_backend == "hnsw":
+            return HnswStore(path, name, dimension, self.cursor, **self.vector_options)
+        if self.vector_backend in ("int8", "binary"):
+            return QuantizedStore(path, name, dimension, mode = self.vector_backend, **self.vector_options)
+        # None makes Virtual_Table use its own vss0 table.
+        return None
+    
     def create(self, path: str = "", page=None, on_created=None):
         try:
             self.on_created = on_created
@@ -205,7 +814,7 @@ class Database:
         if path:
             if not path.endswith('.db'):
                 path = path + '.db'
-            success = self.initiate(path)
+            success = self._initiate_selected(path)
             if success and self.on_created:
                 self.on_created(self)
         else:
@@ -232,9 +841,16 @@ class Database:
             if self.on_opened:
                 self.on_opened(None)
     
+    def _initiate_selected(self, path: str) -> bool:
+        # Called from dialog callbacks, where an exception would go unseen.
+        try:
+            return self.initiate(path)
+        except VectorBackendMismatchError:
+            return False
+    
     def _handle_open_selection(self, path):
         if path:
-            success = self.initiate(path)
+            success = self._initiate_selected(path)
             if success and self.on_opened:
                 self.on_opened(self)
         else:
@@ -260,6 +876,63 @@ class Database:
             result[table.name] = table.select(fields = table_fields, condition = table_conditions, values = table_values)
         return result
     
+    def resolve_hits(self, hits: list[tuple]) -> list[tuple]:
+        """
+        Map (embedding rowid, distance) hits to their stored chunk text in one query
+        Returns: (chunk id, content, distance) rows in hit order. Embeddings
+        saved before chunks were stored fall back to the whole message, with
+        a chunk id of None.
+        """
+        if not hits:
+            return []
+        try:
+            command = SQL_VIRTUAL_TABLE_commands().resolve_hits.format(
+                hits = ", ".join(["(?, ?, ?)" for _ in hits])
+            )
+            values = [value for rank, (rowid, distance) in enumerate(hits) for value in (rowid, distance, rank)]
+            return self.cursor.execute(command, values).fetchall()
+        except sqlite3.Error:
+            return []
+    
+    def search_text(self, query: str, limit: int = 5, source: str = None, source_id: int = None) -> list[tuple]:
+        """
+        BM25 search of the chunk text index, optionally limited to the chunks of one source
+        Returns: (chunk id, content, score) rows, best first (lower bm25 scores are better)
+        """
+        terms = re.findall(r"\w+", query)
+        if not terms:
+            return []
+        try:
+            # Each term is quoted so user text cannot be read as FTS5 syntax.
+            match = " OR ".join('"' + term + '"' for term in terms)
+            condition = ""
+            values = [match]
+            if source is not None:
+                condition = "AND chunks.source = ? AND chunks.source_id = ?"
+                values += [source, source_id]
+            command = SQL_VIRTUAL_TABLE_commands().search_text.format(condition = condition)
+            return self.cursor.execute(command, values + [limit]).fetchall()
+        except sqlite3.Error:
+            return []
+    
+    def neighbor_chunks(self, chunk_ids: list[int], window: int) -> dict:
+        """
+        Get the chunks within window positions of each chunk, from the same source
+        Returns: {chunk id: [(start_token, end_token, content), ...]} in position order
+        """
+        if not chunk_ids:
+            return {}
+        try:
+            command = SQL_VIRTUAL_TABLE_commands().neighbor_chunks.format(
+                ids = ", ".join(["?" for _ in chunk_ids])
+            )
+            neighbors = {}
+            for chunk_id, start, end, content in self.cursor.execute(command, [window, window, *chunk_ids]).fetchall():
+                neighbors.setdefault(chunk_id, []).append((start, end, content))
+            return neighbors
+        except sqlite3.Error:
+            return {}
+    
     def delete(self):
         try:
             import subprocess
@@ -267,6 +940,41 @@ class Database:
         except:
             pass
     
+    @contextmanager
+    def transaction(self):
+        if not self.conn:
+            raise NonOpenedDatabaseError("Database is not opened")
+        self._set_defer_commit(True)
+        self._transaction_depth += 1
+        try:
+            yield self
+        except Exception:
+            self._transaction_depth -= 1
+            if self._transaction_depth == 0:
+                self._set_defer_commit(False)
+                self.conn.rollback()
+                for table in self.tables:
+                    table.after_rollback()
+            raise
+        else:
+            self._transaction_depth -= 1
+            if self._transaction_depth == 0:
+                self._set_defer_commit(False)
+                try:
+                    self.conn.commit()
+                except Exception:
+                    # e.g. vss0 training, which only runs on commit, failed.
+                    self.conn.rollback()
+                    for table in self.tables:
+                        table.after_rollback()
+                    raise
+                for table in self.tables:
+                    table.after_commit()
+    
+    def _set_defer_commit(self, defer: bool):
+        for table in self.tables:
+            table.defer_commit = defer
+    
     def link_tables(self, link_Table: Table, link_record: list, link_attributes: list[str] = None):
         try:
             link_Table.insert(link_record, link_attributes)
@@ -275,6 +983,9 @@ class Database:
     
     def close_connection(self):
         try:
+            for table in self.tables:
+                if isinstance(table, Virtual_Table):
+                    table.close()
             if self.conn:
                 self.conn.close()
         except:
@@ -0,0 +1,172 @@
+import itertools
+import pysqlite3 as sqlite3
+import numpy as np
+from . import embeddings
+from .database import Database, fuse_results
+
+SOURCE = "document"
+
+def find(opened_db: Database, sha256: str):
+    """
+    Returns: id of the indexed document with this content hash, or None
+    """
+    rows = opened_db.get_table("documents").select(["id"], "sha256 = ?", [sha256])
+    return rows[0][0] if rows else None
+
+def embed_batches(path: str, extract, batch_size: int = embeddings.BATCH_SIZE):
+    """
+    Extract, chunk and embed a file without touching the database, so it
+    can run alongside work that does; store_batches() writes the result
+    extract: called with path to get the file text; it may return a string
+    or yield pieces of text (e.g. PDF pages), which are chunked and embedded
+    as they arrive
+    Yields: (spans, vectors) batches of at most batch_size chunks
+    """
+    text = extract(path) or ""
+    batch = []
+    for span in embeddings.chunk_stream([text] if isinstance(text, str) else text):
+        batch.append(span)
+        if len(batch) == batch_size:
+            yield batch, embeddings.embed_chunks([text for _, _, text in batch], batch_size)
+            batch = []
+    if batch:
+        yield batch, embeddings.embed_chunks([text for _, _, text in batch], batch_size)
+
+def store_batches(opened_db: Database, sha256: str, name: str, batches):
+    """
+    Store the batches made by embed_batches() as a document, one batch at a
+    time, unless its content is already stored
+    Returns: document id, or None when there are no batches (the file has no text)
+    """
+    document_id = find(opened_db, sha256)
+    if document_id is not None:
+        return document_id
+    batches = iter(batches)
+    first_batch = next(batches, None)
+    if first_batch is None:
+        return None
+    documents_table = opened_db.get_table("documents")
+    
+    with opened_db.transaction():
+        document_ids = documents_table.insert_many([[sha256, name, 0]], ["sha256", "name", "chunk_count"])
+        if not document_ids:
+            raise RuntimeError("Failed to insert document")
+        document_id = document_ids[0]
+        
+        position = 0
+        for spans, vectors in itertools.chain([first_batch], batches):
+            _store_chunks(opened_db, [(document_id, position + offset, span) for offset, span in enumerate(spans)], vectors)
+            position += len(spans)
+        documents_table.update({"chunk_count": position}, "id = ?", [document_id])
+    return document_id
+
+def index_many(opened_db: Database, texts: list[tuple]) -> list:
+    """
+    Index several extracted texts at once: their chunks are embedded
+    together and every table is filled with one bulk insert
+    texts: (sha256, name, text) tuples
+    Returns: the document id of each tuple, None when its text is empty
+    """
+    document_ids = {}
+    new_documents = []
+    for sha256, name, text in texts:
+        if sha256 in document_ids:
+            continue
+        document_ids[sha256] = find(opened_db, sha256)
+        if document_ids[sha256] is None:
+            spans = embeddings.chunk_spans(text or "")
+            if spans:
+                new_documents.append((sha256, name, spans))
+    
+    if new_documents:
+        with opened_db.transaction():
+            inserted_ids = opened_db.get_table("documents").insert_many(
+                [[sha256, name, len(spans)] for sha256, name, spans in new_documents],
+                ["sha256", "name", "chunk_count"]
+            )
+            if len(inserted_ids) != len(new_documents):
+                raise RuntimeError("Failed to insert documents")
+            _store_chunks(opened_db, [
+                (document_id, position, span)
+                for document_id, (_, _, spans) in zip(inserted_ids, new_documents)
+                for position, span in enumerate(spans)
+            ])
+            for document_id, (sha256, _, _) in zip(inserted_ids, new_documents):
+                document_ids[sha256] = document_id
+    return [document_ids[sha256] for sha256, _, _ in texts]
+
+def delete(opened_db: Database, document_id: int):
+    """
+    Remove a document with its chunks, their text index entries and their vectors
+    """
+    chunks_table = opened_db.get_table("chunks")
+    condition = "source = ? AND source_id = ?"
+    rows = chunks_table.select(["embedding_rowid"], condition, [SOURCE, document_id])
+    with opened_db.transaction():
+        if not opened_db.get_table("embeddings").delete_many([rowid for rowid, in rows]):
+            raise RuntimeError("Failed to delete document embeddings")
+        if not chunks_table.delete_where(condition, [SOURCE, document_id]):
+            raise RuntimeError("Failed to delete document chunks")
+        if not opened_db.get_table("documents").delete_where("id = ?", [document_id]):
+            raise RuntimeError("Failed to delete document")
+
+def _store_chunks(opened_db: Database, chunks: list[tuple], vectors = None):
+    """
+    chunks: (document id, position, (start_token, end_token, text)) tuples
+    vectors: their embeddings, computed here when not given
+    """
+    if vectors is None:
+        vectors = embeddings.embed_chunks([text for _, _, (_, _, text) in chunks], opened_db=opened_db)
+    embedding_ids = opened_db.get_table("embeddings").insert_many(list(vectors))
+    if len(embedding_ids) != len(vectors):
+        raise RuntimeError("Failed to insert document embeddings")
+    
+    chunk_ids = opened_db.get_table("chunks").insert_many(
+        [
+            [SOURCE, document_id, position, start, end, text, embedding_id]
+            for (document_id, position, (start, end, text)), embedding_id in zip(chunks, embedding_ids)
+        ],
+        ["source", "source_id", "position", "start_token", "end_token", "content", "embedding_rowid"]
+    )
+    if len(chunk_ids) != len(chunks):
+        raise RuntimeError("Failed to insert document chunks")
+
+def search(question_embeddings, opened_db: Database, document_id: int, limit: int = 5, fusion: str = "min") -> list[tuple]:
+    """
+    Exact vector search over the chunks of one document
+    The chunk vectors are read back from the vector store by rowid, so no
+    backend has to support filtered search. Each question vector is scored
+    on its own and the results are fused like Virtual_Table.search_similar.
+    Returns: (chunk id, content, distance) rows, closest first
+    """
+    rows = opened_db.get_table("chunks").select(
+        ["id", "content", "embedding_rowid"],
+        "source = ? AND source_id = ? ORDER BY position",
+        [SOURCE, document_id]
+    )
+    if not rows or len(question_embeddings) == 0:
+        return []
+    vectors = _chunk_vectors(opened_db, rows)
+    queries = np.asarray(question_embeddings, dtype=np.float32).reshape(-1, vectors.shape[1])
+    distances = (
+        np.einsum("ij,ij->i", vectors, vectors)[:, None]
+        - 2 * (vectors @ queries.T)
+        + np.einsum("ij,ij->i", queries, queries)[None, :]
+    )
+    k = min(limit, len(rows))
+    results_per_query = [
+        [(int(i), float(distances[i, query])) for i in np.argsort(distances[:, query])[:k]]
+        for query in range(len(queries))
+    ]
+    return [(rows[i][0], rows[i][1], distance) for i, distance in fuse_results(results_per_query, fusion)[:limit]]
+
+def _chunk_vectors(opened_db: Database, rows: list[tuple]) -> np.ndarray:
+    """
+    rows: (chunk id, content, embedding rowid) rows
+    Returns: their vectors from the vector store, or re-embedded when the
+    store cannot return them (e.g. an IVF index without a direct map)
+    """
+    try:
+        return opened_db.get_table("embeddings").store.get([rowid for _, _, rowid in rows])
+    except (KeyError, NotImplementedError, sqlite3.Error):
+        return embeddings.embed_chunks([content for _, content, _ in rows], opened_db=opened_db)
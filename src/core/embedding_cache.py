@@ -0,0 +1,99 @@
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+class EmbeddingCache:
+    """
+    In-memory LRU of chunk embeddings, backed by the embedding_cache table
+    Shared by the threads that embed questions and documents, so the LRU is
+    only touched under a lock.
+    """
+    def __init__(self, capacity: int = 4096):
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def make_key(chunk: str, model_name: str, max_tokens: int, overlap: int) -> str:
+        digest = hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+        return f"{model_name}:{max_tokens}:{overlap}:{digest}"
+    
+    def get_many(self, keys: list[str], opened_db=None) -> dict:
+        found = {}
+        missing = []
+        with self._lock:
+            for key in keys:
+                vector = self._entries.get(key)
+                if vector is not None:
+                    self._entries.move_to_end(key)
+                    found[key] = vector
+                    self.memory_hits += 1
+                elif key not in missing:
+                    missing.append(key)
+        
+        if missing and opened_db:
+            rows = self._select(opened_db, missing)
+            with self._lock:
+                for key, vector in rows:
+                    found[key] = vector
+                    self._remember(key, vector)
+                    self.db_hits += 1
+        
+        with self._lock:
+            self.misses += len([key for key in missing if key not in found])
+        return found
+    
+    def put_many(self, entries: dict, opened_db=None):
+        with self._lock:
+            for key, vector in entries.items():
+                self._remember(key, vector)
+        if opened_db and entries:
+            try:
+                cache_table = opened_db.get_table("embedding_cache")
+            except ValueError:
+                return
+            cache_table.insert_many(
+                [[key, np.asarray(vector, dtype=np.float32).tobytes()] for key, vector in entries.items()],
+                ["key", "embedding"]
+            )
+    
+    def _select(self, opened_db, keys: list[str]):
+        try:
+            cache_table = opened_db.get_table("embedding_cache")
+        except ValueError:
+            return []
+        rows = []
+        # Stay under SQLite's bound-variable limit on large batches.
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            rows.extend(cache_table.select(
+                ["key", "embedding"],
+                f"key IN ({', '.join(['?' for _ in batch])})",
+                batch
+            ))
+        return [(key, np.frombuffer(blob, dtype=np.float32)) for key, blob in rows]
+    
+    def _remember(self, key: str, vector):
+        # Called with the lock held.
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+    
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "memory_hits": self.memory_hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "capacity": self.capacity
+            }
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -1,40 +1,180 @@
-from sentence_transformers import SentenceTransformer
-from tiktoken import get_encoding
+import threading
 import numpy as np
+from .embedding_cache import EmbeddingCache
 
-model = SentenceTransformer('all-MiniLM-L6-v2')
-encoding = get_encoding("cl100k_base")
+MODEL_NAME = 'all-MiniLM-L6-v2'
+ENCODING_NAME = "cl100k_base"
+BATCH_SIZE = 64
+MAX_TOKENS = 500
+OVERLAP = 50
 
-def chunk_text(text, max_tokens=500, overlap=50):
+cache = EmbeddingCache()
+
+_model = None
+_encoder = None
+_model_lock = threading.Lock()
+_encoder_lock = threading.Lock()
+_warm_up_thread = None
+
+def get_model():
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from sentence_transformers import SentenceTransformer
+                _model = SentenceTransformer(MODEL_NAME)
+    return _model
+
+def get_encoder():
+    global _encoder
+    if _encoder is None:
+        with _encoder_lock:
+            if _encoder is None:
+                from tiktoken import get_encoding
+                _encoder = get_encoding(ENCODING_NAME)
+    return _encoder
+
+def _load():
+    try:
+        get_encoder()
+        get_model()
+    except Exception:
+        # Loading is retried on first use, where the error can surface.
+        pass
+
+def warm_up(background: bool = True):
+    global _warm_up_thread
+    if not background:
+        _load()
+        return None
+    if _warm_up_thread is None:
+        _warm_up_thread = threading.Thread(target=_load, name="embeddings-warm-up", daemon=True)
+        _warm_up_thread.start()
+    return _warm_up_thread
+
+def is_ready():
+    return _model is not None and _encoder is not None
+
+def chunk_spans(text, max_tokens=MAX_TOKENS, overlap=OVERLAP):
     text = text.strip()
     if not text:
         return []
     
+    encoding = get_encoder()
     tokens = encoding.encode(text)
     
     if len(tokens) <= max_tokens:
-        return [encoding.decode(tokens)]
+        return [(0, len(tokens), encoding.decode(tokens))]
     
-    chunks = []
+    spans = []
     start = 0
     while start < len(tokens):
-        end = start + max_tokens
-        chunk = tokens[start:end]
-        chunks.append(encoding.decode(chunk))
+        end = min(start + max_tokens, len(tokens))
+        spans.append((start, end, encoding.decode(tokens[start:end])))
         start += max_tokens - overlap
-    return chunks
+    return spans
 
-def generate(text):
-    text = text.strip()
-    if not text:
-        return []
+def chunk_stream(pieces, max_tokens=MAX_TOKENS, overlap=OVERLAP):
+    """
+    Chunk text that arrives in pieces, such as PDF pages, as it is produced
+    Yields (start_token, end_token, text) spans with offsets into the
+    concatenated pieces; only the tokens of the chunk being filled are kept.
+    """
+    encoding = get_encoder()
+    buffer = []
+    # buffer[start:] are the tokens not yet chunked; offset is the position of
+    # buffer[start] in the concatenated pieces.
+    start = 0
+    offset = 0
+    emitted = False
+    step = max_tokens - overlap
+    for piece in pieces:
+        buffer.extend(encoding.encode(piece))
+        while len(buffer) - start > max_tokens:
+            text = encoding.decode(buffer[start:start + max_tokens])
+            if text.strip():
+                yield offset, offset + max_tokens, text
+                emitted = True
+            start += step
+            offset += step
+        # Drop the consumed prefix only once it is most of the buffer, so a
+        # large piece is not copied again for every chunk.
+        if start > len(buffer) // 2:
+            del buffer[:start]
+            start = 0
+    remaining = len(buffer) - start
+    if remaining and (not emitted or remaining > overlap):
+        text = encoding.decode(buffer[start:])
+        if text.strip():
+            yield offset, offset + remaining, text
+
+def chunk_text(text, max_tokens=MAX_TOKENS, overlap=OVERLAP):
+    return [chunk for _, _, chunk in chunk_spans(text, max_tokens, overlap)]
+
+def merge_spans(spans: list[tuple]) -> str:
+    """
+    Join consecutive (start_token, end_token, text) spans of one source,
+    dropping the tokens each span shares with the previous one
+    """
+    encoding = get_encoder()
+    parts = []
+    covered = None
+    for start, end, text in spans:
+        if covered is not None:
+            if end <= covered:
+                continue
+            if start < covered:
+                text = encoding.decode(encoding.encode(text)[covered - start:])
+        parts.append(text)
+        covered = end
+    return "".join(parts)
+
+def generate_many(texts: list[str], batch_size: int = BATCH_SIZE, opened_db=None):
+    chunks_per_text = [chunk_text(text) for text in texts]
+    all_embeddings = embed_chunks(
+        [chunk for chunks in chunks_per_text for chunk in chunks],
+        batch_size,
+        opened_db
+    )
     
-    embeddings = []
-    chunks = chunk_text(text)
+    results = []
+    start = 0
+    for chunks in chunks_per_text:
+        end = start + len(chunks)
+        results.append(all_embeddings[start:end] if chunks else [])
+        start = end
+    return results
+
+def embed_chunks(chunks: list[str], batch_size: int = BATCH_SIZE, opened_db=None):
     if not chunks:
-        return [] 
+        return np.empty((0, 0), dtype=np.float32)
     
-    for chunk in chunks:
-        embedding = model.encode(chunk, convert_to_numpy=True, normalize_embeddings=True)
-        embeddings.append(embedding)
-    return np.array(embeddings)
+    keys = [EmbeddingCache.make_key(chunk, MODEL_NAME, MAX_TOKENS, OVERLAP) for chunk in chunks]
+    vectors = cache.get_many(keys, opened_db)
+    
+    missing = {}
+    for key, chunk in zip(keys, chunks):
+        if key not in vectors and key not in missing:
+            missing[key] = chunk
+    
+    if missing:
+        # One encode call for every uncached chunk: SentenceTransformer sorts
+        # by length and pads per batch internally, so batch_size is the only
+        # knob needed.
+        encoded = get_model().encode(
+            list(missing.values()),
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        )
+        new_vectors = dict(zip(missing.keys(), encoded))
+        cache.put_many(new_vectors, opened_db)
+        vectors.update(new_vectors)
+    
+    return np.array([vectors[key] for key in keys], dtype=np.float32)
+
+def generate(text, opened_db=None):
+    return generate_many([text], opened_db=opened_db)[0]
+
+def cache_stats():
+    return cache.stats()
@@ -0,0 +1,132 @@
+import hashlib
+import os
+import tempfile
+import zlib
+
+DEFAULT_DIRECTORY = os.path.join(os.path.expanduser("~"), ".rag_assistant", "extraction_cache")
+
+def content_hash(path: str, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """
+    Extracted file text on disk, zlib-compressed, one file per key
+    The least recently used entries are deleted once the directory grows
+    past max_bytes; a hit refreshes the entry's modification time.
+    """
+    SUFFIX = ".txt.z"
+    
+    def __init__(self, directory: str = DEFAULT_DIRECTORY, max_bytes: int = 512 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def make_key(content_hash: str, extractor_version: int, ocr_languages: str) -> str:
+        return hashlib.sha256(f"{extractor_version}:{ocr_languages}:{content_hash}".encode("utf-8")).hexdigest()
+    
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + self.SUFFIX)
+    
+    def get(self, key: str):
+        """
+        Returns: the cached text, or None
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                text = zlib.decompress(f.read()).decode("utf-8")
+            os.utime(path)
+            self.hits += 1
+            return text
+        except (OSError, zlib.error, UnicodeDecodeError):
+            self.misses += 1
+            return None
+    
+    def put(self, key: str, text: str):
+        for _ in self.put_pieces(key, [text]):
+            pass
+    
+    def put_pieces(self, key: str, pieces):
+        """
+        Pass pieces of text through while compressing them into the cache
+        The entry is only stored once every piece has been consumed, so an
+        interrupted extraction leaves nothing behind.
+        """
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            f = tempfile.NamedTemporaryFile(dir=self.directory, suffix=".tmp", delete=False)
+        except OSError:
+            yield from pieces
+            return
+        
+        complete = False
+        try:
+            compressor = zlib.compressobj(6)
+            caching = True
+            for piece in pieces:
+                if caching:
+                    try:
+                        f.write(compressor.compress(piece.encode("utf-8")))
+                    except OSError:
+                        caching = False
+                yield piece
+            if caching:
+                try:
+                    f.write(compressor.flush())
+                    f.close()
+                    os.replace(f.name, self._path(key))
+                    complete = True
+                    self._evict()
+                except OSError:
+                    pass
+        finally:
+            f.close()
+            if not complete and os.path.exists(f.name):
+                os.remove(f.name)
+    
+    def _entries(self) -> list[tuple]:
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(self.SUFFIX):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+    
+    def _evict(self):
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+    
+    def stats(self) -> dict:
+        try:
+            entries = self._entries()
+        except OSError:
+            entries = []
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes
+        }
+    
+    def clear(self):
+        try:
+            for _, _, path in self._entries():
+                os.remove(path)
+        except OSError:
+            pass
@@ -1,6 +1,20 @@
 from groq import Groq
 import flet as ft
+import importlib.util
 import os
+import threading
+import httpx
+from .packing import truncate
+
+MODEL = "llama-3.3-70b-versatile"
+SUMMARY_MAX_TOKENS = 256
+SUMMARY_INPUT_TOKENS = 4000
+TIMEOUT = 60.0
+CONNECT_TIMEOUT = 10.0
+KEEPALIVE_EXPIRY = 120.0
+
+_clients = {}
+_clients_lock = threading.Lock()
 
 class NonLoadedKeyError(Exception):
     pass
@@ -44,11 +58,44 @@ class Key:
             file_types=[("Text files", "*.txt")]
         )
 
+def _http_client():
+    # httpx only speaks HTTP/2 when the optional h2 package is installed.
+    return httpx.Client(
+        http2=importlib.util.find_spec("h2") is not None,
+        timeout=httpx.Timeout(TIMEOUT, connect=CONNECT_TIMEOUT),
+        limits=httpx.Limits(max_keepalive_connections=4, keepalive_expiry=KEEPALIVE_EXPIRY)
+    )
+
+def get_client(api_key: str) -> Groq:
+    """
+    Long-lived client for an API key; its kept-alive connections save the
+    TCP and TLS setup on every later request
+    """
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            client = Groq(api_key=api_key, http_client=_http_client())
+            _clients[api_key] = client
+        return client
+
+def close_client(api_key: str = None):
+    """
+    Close the client of an API key, or every client when no key is given
+    """
+    with _clients_lock:
+        keys = [api_key] if api_key is not None else list(_clients)
+        clients = [_clients.pop(key) for key in keys if key in _clients]
+    for client in clients:
+        try:
+            client.close()
+        except Exception:
+            pass
+
 class Completion:
     def __init__(self, api_key):
-        self.client = Groq(api_key=api_key)
+        self.client = get_client(api_key)
         self.parameters = {
-            "model": "llama-3.3-70b-versatile",
+            "model": MODEL,
             "temperature": 1,
             "max_completion_tokens": 4096,
             "top_p": 1,
@@ -69,3 +116,28 @@ def response(messages, key: Key):
         return result
     except Exception:
         return None
+
+def summarize(previous_summary: str, messages: list[dict], key: Key) -> str:
+    """
+    Fold messages into a running conversation summary
+    Returns: the new summary, or previous_summary if the request fails
+    """
+    try:
+        if not key or not key.get_value():
+            return previous_summary
+        transcript = "\n".join(f"{message['role']}: {message['content']}" for message in messages)
+        transcript, _ = truncate(transcript, SUMMARY_INPUT_TOKENS)
+        request = f"Current summary:\n{previous_summary or '(none)'}\n\nNew messages:\n{transcript}"
+        completion = get_client(key.get_value()).chat.completions.create(
+            model=MODEL,
+            messages=[
+                {"role": "system", "content": "Update the summary of this conversation with the new messages. Keep facts, names, decisions and open questions. Answer with the summary only, under 150 words."},
+                {"role": "user", "content": request}
+            ],
+            max_completion_tokens=SUMMARY_MAX_TOKENS,
+            temperature=0,
+            stream=False
+        )
+        return completion.choices[0].message.content.strip() or previous_summary
+    except Exception:
+        return previous_summary
@@ -2,16 +2,48 @@ from . import embeddings
 from .database import Database
 
 def save(opened_db, messages: list[dict]):
+    if not messages:
+        return
+    
     history_table = opened_db.get_table("history")
     embeddings_table = opened_db.get_table("embeddings")
     embeddings_message_table = opened_db.get_table("embeddings_message")
-    for message in messages:
-        message_record = list(message.values())
-        history_table.insert(message_record, ["role", "content"])
-        message_id = history_table.db_cursor.lastrowid
-        message_embeddings = embeddings.generate(message["content"])
-        for embedding in message_embeddings:
-            embeddings_table.insert([embedding])
-            embedding_id = embeddings_table.db_cursor.lastrowid
-            opened_db.link_tables(embeddings_message_table, [embedding_id, message_id])
-
+    chunks_table = opened_db.get_table("chunks")
+    messages_spans = [embeddings.chunk_spans(message["content"]) for message in messages]
+    vectors = embeddings.embed_chunks(
+        [text for spans in messages_spans for _, _, text in spans],
+        opened_db=opened_db
+    )
+    
+    with opened_db.transaction():
+        message_ids = history_table.insert_many(
+            [[message["role"], message["content"]] for message in messages],
+            ["role", "content"]
+        )
+        if len(message_ids) != len(messages):
+            raise RuntimeError("Failed to insert messages into history")
+        if len(vectors) == 0:
+            return
+        
+        embedding_ids = embeddings_table.insert_many(list(vectors))
+        if len(embedding_ids) != len(vectors):
+            raise RuntimeError("Failed to insert message embeddings")
+        
+        links = []
+        chunks = []
+        embedding_index = 0
+        for message_id, spans in zip(message_ids, messages_spans):
+            for position, (start, end, text) in enumerate(spans):
+                embedding_id = embedding_ids[embedding_index]
+                links.append([embedding_id, message_id])
+                chunks.append(["history", message_id, position, start, end, text, embedding_id])
+                embedding_index += 1
+        
+        if len(embeddings_message_table.insert_many(links, ["embedding_rowid", "message_id"])) != len(links):
+            raise RuntimeError("Failed to link message embeddings")
+        chunk_ids = chunks_table.insert_many(
+            chunks,
+            ["source", "source_id", "position", "start_token", "end_token", "content", "embedding_rowid"]
+        )
+        if len(chunk_ids) != len(chunks):
+            raise RuntimeError("Failed to insert message chunks")
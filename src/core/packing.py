@@ -0,0 +1,57 @@
+from . import embeddings
+
+CONTEXT_BUDGET = 2000
+FILE_BUDGET = 4000
+HISTORY_BUDGET = 2000
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    return len(embeddings.get_encoder().encode(text))
+
+def truncate(text: str, budget: int) -> tuple[str, int]:
+    """
+    Keep the first budget tokens of text
+    Returns: (kept text, number of dropped tokens)
+    """
+    if not text:
+        return "", 0
+    encoding = embeddings.get_encoder()
+    tokens = encoding.encode(text)
+    if len(tokens) <= budget:
+        return text, 0
+    return encoding.decode(tokens[:max(budget, 0)]), len(tokens) - max(budget, 0)
+
+def pack_ranked(ranked: list[tuple], budget: int) -> tuple[list[str], int, int]:
+    """
+    Greedily keep the highest scoring passages that fit in budget; a passage
+    too large for the remaining budget is skipped so smaller ones can still fit
+    ranked: (content, score) pairs, higher scores are more relevant
+    Returns: (kept passages, used tokens, dropped tokens)
+    """
+    kept = []
+    used = 0
+    dropped = 0
+    for content, _ in sorted(ranked, key=lambda item: item[1], reverse=True):
+        tokens = count_tokens(content)
+        if used + tokens <= budget:
+            kept.append(content)
+            used += tokens
+        else:
+            dropped += tokens
+    return kept, used, dropped
+
+
+class PackedContext:
+    """
+    Retrieved context and file content cut to their token budgets
+    Budget left unused by the retrieved context is given to the file content.
+    """
+    def __init__(self, ranked_context: list[tuple] = None, file_content: str = "", context_budget: int = CONTEXT_BUDGET, file_budget: int = FILE_BUDGET):
+        passages, used, self.context_dropped = pack_ranked(ranked_context or [], context_budget)
+        self.context = "\n\n".join(passages)
+        self.file, self.file_dropped = truncate(file_content, file_budget + context_budget - used)
+    
+    @property
+    def dropped_tokens(self) -> int:
+        return self.context_dropped + self.file_dropped
@@ -0,0 +1,107 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="pipeline")
+
+class Pipeline:
+    """
+    Runs the independent stages of one request concurrently and records
+    how long each stage took
+    Stages started with start() run on a shared thread pool; run() times a
+    stage on the calling thread. A stage started with start_stream() hands
+    its items over one by one through a bounded queue.
+    """
+    def __init__(self):
+        self.timings = {}
+        self._futures = {}
+        self._streams = {}
+        self._started = time.perf_counter()
+    
+    def _timed(self, name, function, args):
+        started = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            self.timings[name] = time.perf_counter() - started
+    
+    def start(self, name: str, function, *args):
+        self._futures[name] = _executor.submit(self._timed, name, function, args)
+    
+    def start_stream(self, name: str, iterable, buffer: int = 2):
+        """
+        Iterate iterable on the thread pool, keeping at most buffer items
+        ahead of the consumer, so they never pile up in memory
+        """
+        items = queue.Queue(maxsize=buffer)
+        stop = threading.Event()
+        
+        def put(entry) -> bool:
+            while not stop.is_set():
+                try:
+                    items.put(entry, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+        
+        def produce():
+            try:
+                for item in iterable:
+                    if not put(("item", item)):
+                        return
+                put(("end", None))
+            except Exception as e:
+                put(("error", e))
+            finally:
+                if hasattr(iterable, "close"):
+                    iterable.close()
+        
+        self._streams[name] = (items, stop)
+        self.start(name, produce)
+    
+    def stream(self, name: str):
+        """
+        Yield the items of a stage started with start_stream(), nothing if it
+        was not started; an error of the stage is raised here, and leaving
+        early stops the stage
+        """
+        if name not in self._streams:
+            return
+        items, stop = self._streams[name]
+        try:
+            while True:
+                kind, value = items.get()
+                if kind == "error":
+                    raise value
+                if kind == "end":
+                    return
+                yield value
+        finally:
+            stop.set()
+    
+    def close(self):
+        """
+        Stop the streamed stages whose items were not all consumed
+        """
+        for _, stop in self._streams.values():
+            stop.set()
+    
+    def run(self, name: str, function, *args):
+        return self._timed(name, function, args)
+    
+    def result(self, name: str, default = None):
+        """
+        Wait for a started stage
+        Returns: its result, or default if it was not started
+        """
+        future = self._futures.get(name)
+        if future is None:
+            return default
+        return future.result()
+    
+    def report(self) -> str:
+        total = time.perf_counter() - self._started
+        stages = ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in self.timings.items())
+        return f"{stages}; total {total * 1000:.0f} ms"
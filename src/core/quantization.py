@@ -0,0 +1,127 @@
+import numpy as np
+from .vector_store import NumpyStore, NpyArrayFile
+
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def quantize_int8(vectors: np.ndarray):
+    """
+    Per-vector symmetric int8 quantization
+    Returns: (codes, scales) with vectors ~= codes * scales
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1, keepdims=True) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+def quantize_binary(vectors: np.ndarray) -> np.ndarray:
+    """
+    One sign bit per dimension, packed 8 per byte
+    """
+    return np.packbits(np.asarray(vectors) > 0, axis=1)
+
+def hamming_distances(codes: np.ndarray, query_code: np.ndarray) -> np.ndarray:
+    return POPCOUNT[np.bitwise_xor(codes, query_code)].sum(axis=1, dtype=np.int32)
+
+
+class QuantizedStore(NumpyStore):
+    """
+    NumpyStore that scans compact codes and reranks with the full vectors
+    mode: "int8" (per-vector scaled, 4x smaller) or "binary" (sign bits with
+    Hamming search, 32x smaller). The scan keeps rerank * k candidates per
+    query; only their full-precision rows are read from the float sidecar.
+    """
+    BLOCK_ROWS = 262144
+    
+    def __init__(self, db_path: str, name: str, dimension: int, dtype = np.float32, mode: str = "int8", rerank: int = 10):
+        super().__init__(db_path, name, dimension, dtype)
+        if mode not in ("int8", "binary"):
+            raise ValueError(f"Unknown quantization mode '{mode}'")
+        self.mode = mode
+        self.rerank = rerank
+        self.codes = None
+        self.scales = None
+    
+    def open(self) -> bool:
+        if not super().open():
+            return False
+        try:
+            if self.mode == "int8":
+                self.codes = NpyArrayFile(f"{self.base_path}.int8.npy", np.int8, self.dimension)
+                self.scales = NpyArrayFile(f"{self.base_path}.scales.npy", np.float32, 1)
+                self.codes.rows = self.scales.rows = min(self.codes.rows, self.scales.rows, self.count())
+            else:
+                self.codes = NpyArrayFile(f"{self.base_path}.bits.npy", np.uint8, (self.dimension + 7) // 8)
+                self.codes.rows = min(self.codes.rows, self.count())
+            # Encode vectors committed to the float sidecar but not yet quantized.
+            self._encode_range(self.codes.rows, self.count())
+            return True
+        except (OSError, ValueError):
+            return False
+    
+    def commit(self):
+        start = self.count()
+        super().commit()
+        self._encode_range(start, self.count())
+    
+    def _encode_range(self, start: int, end: int):
+        if start >= end:
+            return
+        vectors = np.asarray(self.vectors.array()[start:end], dtype=np.float32)
+        if self.mode == "int8":
+            codes, scales = quantize_int8(vectors)
+            self.codes.append(codes)
+            self.scales.append(scales)
+        else:
+            self.codes.append(quantize_binary(vectors))
+    
+    def _candidates(self, queries: np.ndarray, count: int) -> np.ndarray:
+        """
+        Rows with the smallest approximate distance to each query, shape (count, queries)
+        """
+        codes = self.codes.array()
+        approximate = np.empty((len(codes), len(queries)), dtype=np.float32)
+        if self.mode == "int8":
+            scales = self.scales.array()[:, 0]
+            for start in range(0, len(codes), self.BLOCK_ROWS):
+                block = codes[start:start + self.BLOCK_ROWS].astype(np.float32)
+                block_scales = scales[start:start + len(block)]
+                dots = (block @ queries.T) * block_scales[:, None]
+                norms = np.einsum("ij,ij->i", block, block) * block_scales ** 2
+                approximate[start:start + len(block)] = norms[:, None] - 2 * dots
+        else:
+            query_codes = quantize_binary(queries)
+            for start in range(0, len(codes), self.BLOCK_ROWS):
+                block = codes[start:start + self.BLOCK_ROWS]
+                for i, query_code in enumerate(query_codes):
+                    approximate[start:start + len(block), i] = hamming_distances(block, query_code)
+        # Removed rows must not take candidate slots from live ones.
+        approximate[self.removed_rows()] = np.inf
+        count = min(count, len(approximate))
+        return np.argpartition(approximate, count - 1, axis=0)[:count]
+    
+    def search(self, query_vectors: list, k: int) -> list[list[tuple]]:
+        if len(query_vectors) == 0:
+            return []
+        if self.count() == 0 or k <= 0:
+            return [[] for _ in query_vectors]
+        queries = np.asarray(query_vectors, dtype=np.float32).reshape(len(query_vectors), self.dimension)
+        candidates_per_query = self._candidates(queries, k * self.rerank)
+        rowids = self.rowids.array()[:, 0]
+        removed = self.removed_rows()
+        results = []
+        for i, query in enumerate(queries):
+            candidates = np.sort(candidates_per_query[:, i])
+            candidates = candidates[~removed[candidates]]
+            difference = np.asarray(self.vectors.array()[candidates], dtype=np.float32) - query
+            distances = np.einsum("ij,ij->i", difference, difference)
+            order = np.argsort(distances)[:k]
+            results.append([(int(rowids[candidates[j]]), float(distances[j])) for j in order])
+        return results
+    
+    def close(self):
+        super().close()
+        if self.codes:
+            self.codes.close()
+        if self.scales:
+            self.scales.close()
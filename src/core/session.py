@@ -1,39 +1,179 @@
+import bisect
+import threading
 from . import groq_API
 from .groq_API import Key
 from . import context
+from . import packing
 from .database import Database
 
+class Generation:
+    """
+    Handle of one request running on a worker thread
+    cancel() can be called from any thread: it runs the registered cancel
+    hooks and closes the open completion stream. on_done runs on the worker
+    once function has returned, after the generation counts as done.
+    """
+    def __init__(self, function, args, on_done = None):
+        self._thread = threading.Thread(target=self._run, args=(function, args, on_done), name="generation", daemon=True)
+        self._finished = threading.Event()
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._cancel_hooks = []
+        self._stream = None
+    
+    def start(self):
+        self._thread.start()
+        return self
+    
+    def _run(self, function, args, on_done):
+        try:
+            function(*args)
+        finally:
+            self._finished.set()
+            if on_done:
+                on_done()
+    
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+    
+    def on_cancel(self, hook):
+        with self._lock:
+            if not self.cancelled:
+                self._cancel_hooks.append(hook)
+                return
+        hook()
+    
+    def set_stream(self, stream):
+        with self._lock:
+            self._stream = stream
+            if not self.cancelled:
+                return
+        self._close_stream(stream)
+    
+    def cancel(self):
+        with self._lock:
+            if self.cancelled:
+                return
+            self._cancelled.set()
+            hooks = self._cancel_hooks
+            stream = self._stream
+        for hook in hooks:
+            try:
+                hook()
+            except Exception as e:
+                print(f"Error in cancel hook: {e}")
+        self._close_stream(stream)
+    
+    @staticmethod
+    def _close_stream(stream):
+        if stream is not None and hasattr(stream, "close"):
+            try:
+                stream.close()
+            except Exception:
+                pass
+    
+    def is_current(self) -> bool:
+        return threading.current_thread() is self._thread
+    
+    def done(self) -> bool:
+        return self._finished.is_set()
+    
+    def wait(self, timeout=None):
+        self._thread.join(timeout)
+
+
 class Session:
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, summarize_history: bool = False):
         self.api_key = Key(api_key)
-        self.messages = Messages()
+        self.messages = Messages(self._summarize if summarize_history else None)
         self._is_active = False
+        self._generation = None
+        self._generation_lock = threading.Lock()
     
     def close(self):
+        self.cancel_generation(wait=True)
+        if self.api_key and self.api_key.get_value():
+            groq_API.close_client(self.api_key.get_value())
         self.messages.clear()
         self._is_active = False
     
+    def submit(self, function, *args, on_done = None):
+        """
+        Run function(*args) on a worker thread as this session's generation
+        Only one generation runs per session at a time.
+        on_done: called on the worker once function has returned, when a new
+        generation can already be submitted
+        Returns: the Generation handle, or None if one is still running
+        """
+        with self._generation_lock:
+            if self.is_generating():
+                return None
+            self._generation = Generation(function, args, on_done)
+            return self._generation.start()
+    
+    def is_generating(self) -> bool:
+        return self._generation is not None and not self._generation.done()
+    
+    def _summarize(self, previous_summary, messages):
+        return groq_API.summarize(previous_summary, messages, self.api_key)
+    
+    def current_generation(self):
+        return self._generation
+    
+    def cancel_generation(self, wait: bool = False):
+        generation = self._generation
+        if generation is None:
+            return
+        generation.cancel()
+        if wait and not generation.is_current():
+            generation.wait()
+    
+    def _cancelled(self) -> bool:
+        generation = self._generation
+        return generation is not None and generation.is_current() and generation.cancelled
+    
     def open(self, on_response=None):
         self._is_active = True
         self.on_response = on_response
         return self
     
-    def send_message(self, question, file_content="", db=None):
+    def send_message(self, question, file_content="", db=None, document_id=None, ranked_context=None):
+        """
+        Build the prompt and stream the reply through on_response
+        ranked_context: (content, score) pairs already retrieved for the question; retrieved from db when None
+        """
         if not self._is_active:
             return
         
         if not self.api_key:
             raise ValueError("API key not set")
         
-        context_text = ""
-        if db:
-            context_text = context.retrieve(question, db)
+        if ranked_context is None:
+            ranked_context = []
+            if db:
+                # Passages of the attached document come first; both lists are
+                # scored the same way, so the packer can mix them by score.
+                document_context = []
+                if document_id is not None:
+                    document_context = context.retrieve_ranked(question, db, document_id=document_id)
+                ranked_context = context.merge_ranked(document_context, context.retrieve_ranked(question, db))
         
-        prompt = Prompt.create(question, context_text, file_content)
+        if self._cancelled():
+            if self.on_response:
+                self.on_response("assistant_cancelled", "")
+            return None
+        
+        prompt = Prompt.create(question, file_content=file_content, ranked_context=ranked_context)
         self.messages.add("user", prompt.format)
+        history, history_dropped = self.messages.window()
+        
+        dropped_tokens = prompt.dropped_tokens + history_dropped
+        if dropped_tokens and self.on_response:
+            self.on_response("context_dropped", dropped_tokens)
         
         try:
-            completion = groq_API.response(self.messages.get_last_three(), self.api_key)
+            completion = groq_API.response(history, self.api_key)
             
             if completion is None:
                 error_msg = "Failed to get response from API. Please check your API key and connection."
@@ -49,9 +189,16 @@ class Session:
                     self.on_response("assistant", error_msg)
                 return None
             
+            generation = self._generation
+            if generation is not None and generation.is_current():
+                # Cancelling closes the stream so a blocked read returns promptly.
+                generation.set_stream(completion)
+            
             full_reply = ""
             try:
                 for chunk in completion:
+                    if self._cancelled():
+                        break
                     if hasattr(chunk, 'choices') and chunk.choices:
                         content = chunk.choices[0].delta.content or ""
                         full_reply += content
@@ -60,11 +207,12 @@ class Session:
             except StopIteration:
                 pass
             except Exception as e:
-                print(f"Error processing stream: {e}")
+                if not self._cancelled():
+                    print(f"Error processing stream: {e}")
             
             self.messages.add("assistant", full_reply)
             if self.on_response:
-                self.on_response("assistant_complete", full_reply)
+                self.on_response("assistant_cancelled" if self._cancelled() else "assistant_complete", full_reply)
             
             return full_reply
             
@@ -77,26 +225,77 @@ class Session:
             return None
     
 class Messages:
-    def __init__(self):
+    """
+    Conversation messages with their token counts cached as prefix sums, so
+    fitting the recent turns into a token budget only counts new messages
+    summarize: optional callable(previous summary, messages) -> summary; when
+    set, turns that leave the window are folded into a rolling summary
+    """
+    def __init__(self, summarize=None):
         self._messages = []
+        self._saved_count = 0
+        self._token_prefix = [0]
+        self.summarize = summarize
+        self.summary = ""
+        self._summarized_count = 0
     
     def add(self, role, content):
         self._messages.append({"role": role, "content": content})
     
-    def get_last_three(self):
-        return self._messages[-3:] if len(self._messages) >= 3 else self._messages
+    def _count_new(self):
+        for message in self._messages[len(self._token_prefix) - 1:]:
+            self._token_prefix.append(self._token_prefix[-1] + packing.count_tokens(message["content"]))
+    
+    def token_count(self, start: int = 0, end: int = None) -> int:
+        self._count_new()
+        end = len(self._messages) if end is None else end
+        return self._token_prefix[end] - self._token_prefix[start]
+    
+    def window(self, budget: int = packing.HISTORY_BUDGET, keep_last: int = 1) -> tuple[list[dict], int]:
+        """
+        The most recent messages whose tokens fit in budget, plus the last
+        keep_last messages, which are always kept and not counted
+        Returns: (messages, tokens left out), with the rolling summary of the
+        older messages first when summarize is set
+        """
+        self._count_new()
+        kept_from = max(len(self._messages) - keep_last, 0)
+        start = bisect.bisect_left(self._token_prefix, self._token_prefix[kept_from] - budget, 0, kept_from)
+        
+        if self.summarize and start > self._summarized_count:
+            try:
+                self.summary = self.summarize(self.summary, self._messages[self._summarized_count:start])
+                self._summarized_count = start
+            except Exception as e:
+                print(f"Error summarizing conversation: {e}")
+        
+        messages = self._messages[start:]
+        if self.summary:
+            messages = [{"role": "system", "content": f"Summary of the earlier conversation: {self.summary}"}] + messages
+        return messages, self._token_prefix[start]
     
     def get_all(self):
         return self._messages.copy() if self._messages else []
     
+    def get_unsaved(self):
+        return self._messages[self._saved_count:]
+    
+    def mark_saved(self, count: int):
+        self._saved_count = min(self._saved_count + count, len(self._messages))
+    
     def clear(self):
         self._messages.clear()
+        self._saved_count = 0
+        self._token_prefix = [0]
+        self.summary = ""
+        self._summarized_count = 0
 
 class Prompt:
     def __init__(self, question, context_text, file_content: str = ""):
         self.question = question
         self.context = context_text
         self.file = file_content
+        self.dropped_tokens = 0
         if self.context and self.file:
             self.format = f"""### Context: \n{self.context + self.file}\n### Question: {self.question}\n### Answer:"""
         elif self.context and not self.file:
@@ -107,5 +306,14 @@ class Prompt:
             self.format = f"""### Question: {self.question}\n### Answer:"""
     
     @classmethod
-    def create(cls, question, context_text="", file_content=""):
-        return cls(question, context_text, file_content)
+    def create(cls, question, context_text="", file_content="", ranked_context=None, context_budget=packing.CONTEXT_BUDGET, file_budget=packing.FILE_BUDGET):
+        """
+        Build a prompt whose context fits the token budgets
+        ranked_context: (content, score) pairs, packed by score; context_text is used when it is not given
+        """
+        if ranked_context is None:
+            ranked_context = [(context_text, 0.0)] if context_text else []
+        packed = packing.PackedContext(ranked_context, file_content, context_budget, file_budget)
+        prompt = cls(question, packed.context, packed.file)
+        prompt.dropped_tokens = packed.dropped_tokens
+        return prompt
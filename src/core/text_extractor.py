@@ -1,8 +1,29 @@
+import multiprocessing
 import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, CancelledError
 import fitz
 import docx
 from PIL import Image
 import pytesseract
+from .extraction_cache import ExtractionCache, content_hash
+
+OCR_LANGUAGES = "eng+fra+ara"
+OCR_DPI = 300
+WORKERS = None
+PAGES_PER_JOB = 8
+# Bump when extraction output changes, so cached text is not reused.
+EXTRACTOR_VERSION = 1
+
+cache = ExtractionCache()
+# Set in pool workers, so a running job stops between pages once cancelled.
+_cancel_event = None
+
+class ExtractionCancelled(Exception):
+    pass
+
+def cache_key(file_path, ocr_languages=OCR_LANGUAGES):
+    return ExtractionCache.make_key(content_hash(file_path), EXTRACTOR_VERSION, ocr_languages)
 
 def from_docx(file_path):
     title = os.path.splitext(os.path.basename(file_path))[0] + "\n"
@@ -12,16 +33,145 @@ def from_docx(file_path):
         text += para.text + "\n"
     return text
 
+def iter_pdf_pages(file_path):
+    """
+    Yield (page_number, text) as each page is decoded, starting at 1
+    Only one page is held in memory at a time.
+    """
+    with fitz.open(file_path) as document:
+        for page_number, page in enumerate(document, start=1):
+            yield page_number, page.get_text()
+
 def from_pdf(file_path):
     title = os.path.splitext(os.path.basename(file_path))[0] + "\n"
-    document = fitz.open(file_path)
-    text = title
-    for page in document:
-        text += page.get_text()
-    return text
+    return title + "".join(text for _, text in iter_pdf_pages(file_path))
 
 def from_image(file_path):
     title = os.path.splitext(os.path.basename(file_path))[0] + "\n"
     image = Image.open(file_path)
-    text = title + pytesseract.image_to_string(image, lang="eng+fra+ara")
+    text = title + pytesseract.image_to_string(image, lang=OCR_LANGUAGES)
     return text
+
+def _init_worker(cancel_event):
+    global _cancel_event
+    _cancel_event = cancel_event
+
+def _pdf_page_range(file_path, start, end, ocr_languages):
+    """
+    Text of pages [start, end), OCR'd from a rendering when a page has no text layer
+    Returns: (page_number, text) pairs
+    """
+    pages = []
+    with fitz.open(file_path) as document:
+        for index in range(start, end):
+            if _cancel_event is not None and _cancel_event.is_set():
+                raise ExtractionCancelled()
+            page = document[index]
+            text = page.get_text()
+            if not text.strip():
+                pixmap = page.get_pixmap(dpi=OCR_DPI)
+                image = Image.frombytes("RGB", (pixmap.width, pixmap.height), pixmap.samples)
+                text = pytesseract.image_to_string(image, lang=ocr_languages)
+            pages.append((index + 1, text))
+    return pages
+
+
+class ParallelExtractor:
+    """
+    Spreads the page ranges of a PDF over a process pool and returns their
+    text in document order
+    cancel() may be called from any thread: queued jobs are dropped, jobs
+    already running in a worker stop at their next page, and the consuming
+    call raises ExtractionCancelled. Jobs run in-process (one job, or one
+    worker) are only stopped between jobs.
+    """
+    def __init__(self, workers: int = WORKERS, pages_per_job: int = PAGES_PER_JOB, ocr_languages: str = OCR_LANGUAGES):
+        self.workers = workers or os.cpu_count() or 1
+        self.pages_per_job = pages_per_job
+        self.ocr_languages = ocr_languages
+        self._cancelled = threading.Event()
+        self._executor = None
+        self._worker_cancel = None
+        self._lock = threading.Lock()
+    
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+    
+    def cancel(self):
+        self._cancelled.set()
+        with self._lock:
+            if self._worker_cancel:
+                self._worker_cancel.set()
+            if self._executor:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+    
+    def map(self, function, jobs: list[tuple]):
+        """
+        Yield function(*job) for each job, in job order
+        At most two jobs per worker are queued, so finished results never
+        pile up ahead of a slow consumer.
+        """
+        if self.cancelled:
+            raise ExtractionCancelled()
+        if len(jobs) <= 1 or self.workers == 1:
+            # Not worth starting processes for.
+            for job in jobs:
+                if self.cancelled:
+                    raise ExtractionCancelled()
+                yield function(*job)
+            return
+        
+        with self._lock:
+            # The app is multi-threaded when this runs, so workers are spawned
+            # rather than forked with another thread's locks held.
+            context = multiprocessing.get_context("spawn")
+            self._worker_cancel = context.Event()
+            if self.cancelled:
+                self._worker_cancel.set()
+            self._executor = ProcessPoolExecutor(
+                max_workers=min(self.workers, len(jobs)),
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(self._worker_cancel,)
+            )
+        try:
+            pending = []
+            next_job = 0
+            while next_job < len(jobs) or pending:
+                while next_job < len(jobs) and len(pending) < self.workers * 2:
+                    pending.append(self._executor.submit(function, *jobs[next_job]))
+                    next_job += 1
+                try:
+                    result = pending.pop(0).result()
+                except CancelledError:
+                    raise ExtractionCancelled()
+                if self.cancelled:
+                    raise ExtractionCancelled()
+                yield result
+        except RuntimeError:
+            # submit() after a concurrent cancel() shut the pool down.
+            if self.cancelled:
+                raise ExtractionCancelled()
+            raise
+        finally:
+            with self._lock:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+    
+    def iter_pdf_pages(self, file_path):
+        """
+        Yield (page_number, text) for every page, in order, with OCR for pages without a text layer
+        """
+        with fitz.open(file_path) as document:
+            page_count = document.page_count
+        jobs = [
+            (file_path, start, min(start + self.pages_per_job, page_count), self.ocr_languages)
+            for start in range(0, page_count, self.pages_per_job)
+        ]
+        for pages in self.map(_pdf_page_range, jobs):
+            yield from pages
+    
+    def from_pdf(self, file_path):
+        title = os.path.splitext(os.path.basename(file_path))[0] + "\n"
+        return title + "".join(text for _, text in self.iter_pdf_pages(file_path))
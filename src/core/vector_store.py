@@ -0,0 +1,230 @@
+import os
+import struct
+import numpy as np
+
+class VectorStore:
+    """
+    Storage and top-k search for the vectors of one Virtual_Table
+    Rowids are allocated by the table; a store only keeps (rowid, vector) pairs.
+    """
+    def open(self) -> bool:
+        return True
+    
+    def max_rowid(self) -> int:
+        return 0
+    
+    def add(self, rowids: list[int], vectors: list):
+        raise NotImplementedError
+    
+    def remove(self, rowids: list[int]):
+        raise NotImplementedError
+    
+    def search(self, query_vectors: list, k: int) -> list[list[tuple]]:
+        """
+        Returns: one list of (rowid, distance) pairs per query vector, closest first
+        """
+        raise NotImplementedError
+    
+    def get(self, rowids: list[int]) -> np.ndarray:
+        """
+        Returns: the stored vectors of rowids, in that order, as float32 rows
+        Raises KeyError when a rowid is not stored.
+        """
+        raise NotImplementedError
+    
+    def count(self) -> int:
+        return 0
+    
+    def commit(self):
+        pass
+    
+    def rollback(self):
+        pass
+    
+    def close(self):
+        pass
+
+
+class NpyArrayFile:
+    """
+    A 2-D .npy file that grows in place: rows are appended after the data and
+    the fixed-size header is rewritten with the new row count.
+    """
+    HEADER_SIZE = 128
+    
+    def __init__(self, path: str, dtype, width: int):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.width = width
+        self._mapped = None
+        if not os.path.exists(self.path):
+            with open(self.path, "wb") as f:
+                self._write_header(f, 0)
+        self.rows = self._read_rows()
+    
+    def _write_header(self, f, rows: int):
+        header = "{'descr': %r, 'fortran_order': False, 'shape': (%d, %d), }" % (self.dtype.str, rows, self.width)
+        header = header.ljust(self.HEADER_SIZE - 11) + "\n"
+        f.seek(0)
+        f.write(b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1"))
+    
+    def _read_rows(self) -> int:
+        with open(self.path, "rb") as f:
+            np.lib.format.read_magic(f)
+            shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+        if dtype != self.dtype or shape[1:] != (self.width,):
+            raise ValueError(f"{self.path} holds {dtype} rows of shape {shape[1:]}, expected {self.dtype} rows of {self.width}")
+        return shape[0]
+    
+    def append(self, rows: np.ndarray):
+        rows = np.ascontiguousarray(rows, dtype=self.dtype).reshape(-1, self.width)
+        with open(self.path, "r+b") as f:
+            f.seek(self.HEADER_SIZE + self.rows * self.width * self.dtype.itemsize)
+            f.write(rows.tobytes())
+            f.truncate()
+            f.flush()
+            os.fsync(f.fileno())
+            # The header is written last so a crash mid-append leaves the
+            # previous row count, and the partial rows are overwritten next time.
+            self._write_header(f, self.rows + len(rows))
+        self.rows += len(rows)
+        self._mapped = None
+    
+    def array(self) -> np.ndarray:
+        if self.rows == 0:
+            return np.empty((0, self.width), dtype=self.dtype)
+        if self._mapped is None:
+            self._mapped = np.load(self.path, mmap_mode="r")
+        return self._mapped[:self.rows]
+    
+    def close(self):
+        self._mapped = None
+
+
+class NumpyStore(VectorStore):
+    """
+    Vectors in a memory-mapped .npy sidecar next to the database, searched
+    exactly with one matrix product and argpartition
+    Distances are squared L2, as returned by vss0's default flat index.
+    Removed rowids are listed in a .removed.npy sidecar and skipped by
+    searches; their rows stay in the file.
+    """
+    BLOCK_ROWS = 65536
+    
+    def __init__(self, db_path: str, name: str, dimension: int, dtype = np.float32):
+        self.base_path = f"{os.path.splitext(db_path)[0]}.{name}"
+        self.dimension = dimension
+        self.dtype = np.dtype(dtype)
+        self.vectors = None
+        self.rowids = None
+        self.removed = None
+        self._pending_rowids = []
+        self._pending_vectors = []
+        self._pending_removed = []
+        self._removed_rows = None
+    
+    def open(self) -> bool:
+        try:
+            self.vectors = NpyArrayFile(f"{self.base_path}.npy", self.dtype, self.dimension)
+            self.rowids = NpyArrayFile(f"{self.base_path}.rowids.npy", np.int64, 1)
+            self.removed = NpyArrayFile(f"{self.base_path}.removed.npy", np.int64, 1)
+            # Recover from an append interrupted between the two files.
+            self.vectors.rows = self.rowids.rows = min(self.vectors.rows, self.rowids.rows)
+            return True
+        except (OSError, ValueError):
+            return False
+    
+    def max_rowid(self) -> int:
+        rowids = self.rowids.array()
+        return int(rowids.max()) if len(rowids) else 0
+    
+    def count(self) -> int:
+        return self.rowids.rows
+    
+    def get(self, rowids: list[int]) -> np.ndarray:
+        wanted = np.asarray(rowids, dtype=np.int64).reshape(-1)
+        # Rowids are allocated in increasing order, so the stored ones are sorted.
+        stored = self.rowids.array()[:, 0]
+        positions = np.minimum(np.searchsorted(stored, wanted), max(len(stored) - 1, 0))
+        found = stored[positions] == wanted if len(stored) else np.zeros(len(wanted), dtype=bool)
+        result = np.empty((len(wanted), self.dimension), dtype=np.float32)
+        if found.any():
+            result[found] = self.vectors.array()[positions[found]]
+        pending = dict(zip(self._pending_rowids, self._pending_vectors))
+        for i in np.flatnonzero(~found):
+            if int(wanted[i]) not in pending:
+                raise KeyError(int(wanted[i]))
+            result[i] = pending[int(wanted[i])]
+        return result
+    
+    def add(self, rowids: list[int], vectors: list):
+        self._pending_rowids.extend(rowids)
+        self._pending_vectors.extend(np.asarray(vector, dtype=np.float32).reshape(self.dimension) for vector in vectors)
+    
+    def remove(self, rowids: list[int]):
+        self._pending_removed.extend(rowids)
+    
+    def commit(self):
+        if self._pending_rowids:
+            self.vectors.append(np.array(self._pending_vectors))
+            self.rowids.append(np.array(self._pending_rowids, dtype=np.int64))
+            self._pending_rowids = []
+            self._pending_vectors = []
+        if self._pending_removed:
+            self.removed.append(np.array(self._pending_removed, dtype=np.int64))
+            self._pending_removed = []
+            self._removed_rows = None
+    
+    def rollback(self):
+        self._pending_rowids = []
+        self._pending_vectors = []
+        self._pending_removed = []
+    
+    def removed_rows(self) -> np.ndarray:
+        """
+        Returns: a boolean mask of the stored rows whose rowid was removed
+        """
+        if self._removed_rows is None or len(self._removed_rows) != self.count():
+            self._removed_rows = np.isin(self.rowids.array()[:, 0], self.removed.array()[:, 0])
+        return self._removed_rows
+    
+    def distances(self, queries: np.ndarray) -> np.ndarray:
+        """
+        Squared L2 distance of every stored vector to every query, shape (rows, queries)
+        """
+        matrix = self.vectors.array()
+        result = np.empty((len(matrix), len(queries)), dtype=np.float32)
+        query_norms = np.einsum("ij,ij->i", queries, queries)
+        # Blocks bound the float32 copy needed when the store is float16.
+        for start in range(0, len(matrix), self.BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + self.BLOCK_ROWS], dtype=np.float32)
+            block_norms = np.einsum("ij,ij->i", block, block)
+            result[start:start + len(block)] = block_norms[:, None] - 2 * (block @ queries.T) + query_norms[None, :]
+        return result
+    
+    def search(self, query_vectors: list, k: int) -> list[list[tuple]]:
+        if len(query_vectors) == 0:
+            return []
+        if self.count() == 0 or k <= 0:
+            return [[] for _ in query_vectors]
+        queries = np.asarray(query_vectors, dtype=np.float32).reshape(len(query_vectors), self.dimension)
+        distances = self.distances(queries)
+        distances[self.removed_rows()] = np.inf
+        rowids = self.rowids.array()[:, 0]
+        k = min(k, len(distances))
+        top = np.argpartition(distances, k - 1, axis=0)[:k]
+        
+        results = []
+        for query in range(len(queries)):
+            candidates = top[:, query]
+            order = candidates[np.argsort(distances[candidates, query])]
+            results.append([(int(rowids[i]), float(distances[i, query])) for i in order if np.isfinite(distances[i, query])])
+        return results
+    
+    def close(self):
+        if self.vectors:
+            self.vectors.close()
+        if self.rowids:
+            self.rowids.close()
+        if self.removed:
+            self.removed.close()
@@ -0,0 +1,191 @@
+import argparse
+import logging
+import os
+import sys
+import time
+
+# Configuration du logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("ingest")
+
+from core import Database
+from core import ParallelExtractor
+from core import text_extractor, documents
+from core.database import VectorBackendMismatchError
+from core.extraction_cache import ExtractionCache, content_hash
+
+EXTENSIONS = ('.pdf', '.docx', '.txt', '.png', '.jpg', '.jpeg')
+# Extracted text gathered before one embedding pass and bulk insert.
+BATCH_CHARACTERS = 1000000
+
+def _extract_file(path):
+    """
+    Runs in a worker process; PDF pages without a text layer are OCR'd
+    Returns: (path, sha256, text, error)
+    """
+    try:
+        sha256 = content_hash(path)
+        lower_path = path.lower()
+        if lower_path.endswith('.txt'):
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                return path, sha256, f.read(), None
+        
+        key = ExtractionCache.make_key(sha256, text_extractor.EXTRACTOR_VERSION, text_extractor.OCR_LANGUAGES)
+        text = text_extractor.cache.get(key)
+        if text is None:
+            if lower_path.endswith('.pdf'):
+                text = ParallelExtractor(workers=1).from_pdf(path)
+            elif lower_path.endswith('.docx'):
+                text = text_extractor.from_docx(path)
+            else:
+                text = text_extractor.from_image(path)
+            text_extractor.cache.put(key, text)
+        return path, sha256, text, None
+    except Exception as e:
+        return path, None, None, str(e)
+
+def find_files(folder: str) -> list[str]:
+    paths = []
+    for root, _, names in os.walk(folder):
+        for name in names:
+            if name.lower().endswith(EXTENSIONS):
+                paths.append(os.path.abspath(os.path.join(root, name)))
+    return sorted(paths)
+
+def _is_unchanged(files_table, path: str, stat) -> bool:
+    rows = files_table.select(["mtime", "size"], "path = ?", [path])
+    return bool(rows) and rows[0][0] == stat.st_mtime and rows[0][1] == stat.st_size
+
+def _recorded_document(files_table, path: str):
+    rows = files_table.select(["document_id"], "path = ?", [path])
+    return rows[0][0] if rows else None
+
+def _record_file(files_table, path: str, stat, sha256: str, document_id):
+    fields = {"mtime": stat.st_mtime, "size": stat.st_size, "sha256": sha256, "document_id": document_id}
+    if files_table.select(["path"], "path = ?", [path]):
+        files_table.update(fields, "path = ?", [path])
+    else:
+        files_table.insert_many([[path, *fields.values()]], ["path", *fields.keys()])
+
+def _chunk_count(opened_db: Database) -> int:
+    rows = opened_db.get_table("chunks").select(["MAX(id)"])
+    return (rows[0][0] or 0) if rows else 0
+
+def ingest(folder: str, opened_db: Database, workers: int = None, batch_characters: int = BATCH_CHARACTERS) -> dict:
+    """
+    Extract, chunk, embed and store every supported file under folder
+    Files whose path, mtime and size are already recorded are skipped
+    without being read; a file whose content is already stored as a
+    document is only recorded. When a changed file no longer leaves any file
+    pointing at its previous document, that document is deleted. Each batch
+    is committed with its files, so an interrupted run resumes where it stopped.
+    Returns: counts of files and chunks with the elapsed time
+    """
+    files_table = opened_db.get_table("files")
+    paths = find_files(folder)
+    pending = []
+    skipped = 0
+    for path in paths:
+        stat = os.stat(path)
+        if _is_unchanged(files_table, path, stat):
+            skipped += 1
+        else:
+            pending.append((path, stat))
+    logger.info(f"{len(paths)} files found, {skipped} unchanged, {len(pending)} to ingest")
+    
+    started = time.perf_counter()
+    first_chunk = _chunk_count(opened_db)
+    ingested = 0
+    failed = 0
+    batch = []
+    batch_size = 0
+    
+    def flush():
+        nonlocal ingested, batch, batch_size
+        if not batch:
+            return
+        with opened_db.transaction():
+            previous_ids = {_recorded_document(files_table, path) for path, _, _, _ in batch}
+            document_ids = documents.index_many(
+                opened_db,
+                [(sha256, os.path.basename(path), text) for path, _, sha256, text in batch]
+            )
+            for (path, stat, sha256, _), document_id in zip(batch, document_ids):
+                _record_file(files_table, path, stat, sha256, document_id)
+            for document_id in previous_ids - set(document_ids) - {None}:
+                if not files_table.select(["path"], "document_id = ?", [document_id]):
+                    documents.delete(opened_db, document_id)
+        ingested += len(batch)
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        chunks = _chunk_count(opened_db) - first_chunk
+        logger.info(
+            f"{ingested + failed}/{len(pending)} files, {ingested / elapsed:.1f} files/s, "
+            f"{chunks} chunks, {chunks / elapsed:.1f} chunks/s"
+        )
+        batch = []
+        batch_size = 0
+    
+    stats_by_path = dict(pending)
+    extractor = ParallelExtractor(workers)
+    for path, sha256, text, error in extractor.map(_extract_file, [(path,) for path, _ in pending]):
+        if error:
+            failed += 1
+            logger.error(f"Failed to extract {path}: {error}")
+            continue
+        batch.append((path, stats_by_path[path], sha256, text))
+        batch_size += len(text or "")
+        if batch_size >= batch_characters:
+            flush()
+    flush()
+    
+    elapsed = time.perf_counter() - started
+    chunks = _chunk_count(opened_db) - first_chunk
+    return {
+        "files": len(paths),
+        "skipped": skipped,
+        "ingested": ingested,
+        "failed": failed,
+        "chunks": chunks,
+        "seconds": elapsed,
+        "files_per_second": ingested / elapsed if elapsed else 0.0,
+        "chunks_per_second": chunks / elapsed if elapsed else 0.0
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest a folder of documents into a RAG Assistant database.")
+    parser.add_argument("folder", help="folder to walk for .pdf, .docx, .txt and image files")
+    parser.add_argument("database", help="path of the .db file, created if missing")
+    parser.add_argument("--workers", type=int, default=None, help="extraction processes (default: CPU count)")
+    parser.add_argument("--vector-backend", default=None, help="vector backend for a new database; an existing one only switches to a backend that can read its vectors")
+    args = parser.parse_args(argv)
+    
+    if not os.path.isdir(args.folder):
+        parser.error(f"{args.folder} is not a folder")
+    
+    db = Database(vector_backend=args.vector_backend)
+    try:
+        opened = db.initiate(args.database)
+    except VectorBackendMismatchError as e:
+        logger.error(str(e))
+        db.close_connection()
+        return 1
+    if not opened:
+        logger.error(f"Could not open {args.database}")
+        return 1
+    try:
+        stats = ingest(args.folder, db, args.workers)
+    except KeyboardInterrupt:
+        logger.info("Interrupted; run again to resume")
+        return 130
+    finally:
+        db.close_connection()
+    
+    print(
+        f"{stats['ingested']} files ingested, {stats['skipped']} unchanged, {stats['failed']} failed, "
+        f"{stats['chunks']} chunks in {stats['seconds']:.1f}s "
+        f"({stats['files_per_second']:.1f} files/s, {stats['chunks_per_second']:.1f} chunks/s)"
+    )
+    return 0 if stats["failed"] == 0 else 2
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,11 @@
+import time
+_startup_time = time.perf_counter()
+
 import flet as ft
 import os
 import json
-import time
 import threading
+import multiprocessing
 import logging
 import tkinter as tk
 from tkinter import filedialog
@@ -13,8 +16,12 @@ logger = logging.getLogger(__name__)
 
 # Imports de la logique métier (core)
 from core import System, Session, Key, Database
-from core import from_pdf, from_docx, from_image
-from core import history, context
+from core import from_docx, from_image
+from core import ParallelExtractor, ExtractionCancelled
+from core import text_extractor
+from core import Pipeline
+from core import history, context, embeddings, documents
+from core.extraction_cache import content_hash
 
 # Imports des composants UI
 from ui import ChatPage, LoginPage, RegisterPage, LogoutPage, ProfilePage, ConfigPage
@@ -24,10 +31,16 @@ class RAGAssistant:
         self.page = page
         self._setup_page()
         
+        # Load the embedding model off the UI thread; the first send only
+        # blocks if this has not finished yet.
+        embeddings.warm_up()
+        
         self.system = System()
         self.current_user = None
         self.current_db = None
         self._session = None
+        self._extractor = None
+        self._streaming_bubble = None
         
         self.login_page = LoginPage()
         self.register_page = RegisterPage()
@@ -41,6 +54,7 @@ class RAGAssistant:
         self.setup_callbacks()
         
         self.show_login_page()
+        logger.info(f"Login page shown {time.perf_counter() - _startup_time:.2f}s after startup")
     
     def _setup_page(self):
         self.page.title = "RAG Assistant"
@@ -73,6 +87,7 @@ class RAGAssistant:
         self.chat_page.set_callbacks({
             "on_send_message": self.handle_send_message,
             "on_attach_file": self.handle_attach_file,
+            "on_stop_generation": self.handle_stop_generation,
             "on_menu_click": self.handle_menu_click,
             "on_profile_click": self.show_profile_page,
             "on_logout_click": self.show_logout_page,
@@ -333,28 +348,116 @@ class RAGAssistant:
         if not text.strip() or not self._session:
             return
         
-        file_content = ""
-        if context and os.path.exists(context):
-            file_content = self.extract_file_content(context)
+        self.chat_page.set_generating(True)
+        # Extraction, retrieval and the streamed reply run on a worker thread
+        # so the window stays responsive and the stop button can cancel them.
+        if self._session.submit(self._process_message, text, context, on_done=self._generation_finished) is None:
+            logger.warning("A reply is still being generated; message ignored")
+            # The running generation re-enables input when it finishes.
+            self.chat_page.set_generating(self._session.is_generating())
+            self.chat_page.add_message("assistant", "This message was not sent because a reply is still being generated. Send it again once the reply has finished.")
+            self.page.update()
+    
+    def _generation_finished(self):
+        # Input is re-enabled only once the reply is saved and the worker is done.
+        self.chat_page.set_generating(False)
+        self.page.update()
+    
+    def _process_message(self, text, file_path):
+        generation = self._session.current_generation()
+        pipeline = Pipeline()
+        document_id = None
+        sha256 = None
+        attached = bool(file_path) and os.path.exists(file_path)
+        if attached:
+            self._extractor = ParallelExtractor()
+            generation.on_cancel(self._extractor.cancel)
+            if self.current_db:
+                # Indexed once per content hash; questions then retrieve only
+                # the relevant passages instead of the whole file.
+                try:
+                    sha256 = pipeline.run("hash", content_hash, file_path)
+                    document_id = documents.find(self.current_db, sha256)
+                    if document_id is None:
+                        # Extraction and chunk embedding do not use the database,
+                        # so they overlap with retrieval for the question.
+                        pipeline.start_stream("document", documents.embed_batches(file_path, self.stream_file_content, embeddings.BATCH_SIZE))
+                except OSError as e:
+                    logger.error(f"Failed to read {file_path}: {e}")
+            else:
+                pipeline.start("extraction", self.extract_file_content, file_path)
+        if self.current_db:
+            pipeline.start("retrieval", context.retrieve_ranked, text, self.current_db)
         
-        self.chat_page.enable_input(False)
+        # Retrieval is joined first: the database is used by one thread at a time.
+        ranked_context = pipeline.result("retrieval", [])
+        try:
+            # Embedded batches are written as they arrive, so memory stays flat.
+            if document_id is None and sha256 is not None:
+                document_id = pipeline.run(
+                    "store",
+                    documents.store_batches,
+                    self.current_db,
+                    sha256,
+                    os.path.basename(file_path),
+                    pipeline.stream("document")
+                )
+        except ExtractionCancelled:
+            logger.info(f"Indexing of {file_path} cancelled")
+        except Exception as e:
+            logger.error(f"Failed to index {file_path}: {e}")
+        finally:
+            pipeline.close()
+        file_content = pipeline.result("extraction", "")
+        if attached and self.current_db and document_id is None and not self._extractor.cancelled:
+            file_content = pipeline.run("extraction", self.extract_file_content, file_path)
+        if document_id is not None:
+            document_context = pipeline.run(
+                "document_retrieval",
+                lambda: context.retrieve_ranked(text, self.current_db, document_id=document_id)
+            )
+            ranked_context = context.merge_ranked(document_context, ranked_context)
+        logger.info(f"Request stages: {pipeline.report()}")
         
-        self._session.send_message(text, file_content, self.current_db)
+        try:
+            self._session.send_message(text, file_content, self.current_db, document_id, ranked_context)
+        except Exception as e:
+            logger.error(f"Failed to send message: {e}")
+            self.handle_session_response("assistant", f"Error: {e}")
+    
+    def handle_stop_generation(self):
+        if self._session:
+            self._session.cancel_generation()
     
     def handle_session_response(self, role, content):
         if role == "user":
             self.chat_page.add_message("user", content)
         elif role == "assistant_chunk":
-            pass
-        elif role == "assistant_complete":
-            self.chat_page.add_message("assistant", content)
-            self.chat_page.enable_input(True)
+            if self._streaming_bubble is None:
+                self._streaming_bubble = self.chat_page.add_streaming_message("assistant")
+                self.page.update()
+            # The bubble redraws itself at a capped rate; no page update per token.
+            self._streaming_bubble.append(content)
+            return
+        elif role == "context_dropped":
+            logger.info(f"Prompt context over budget: {content} tokens dropped")
+            return
+        elif role in ("assistant_complete", "assistant_cancelled"):
+            if self._streaming_bubble is not None:
+                self._streaming_bubble.finish(content)
+                self._streaming_bubble = None
+            elif content:
+                self.chat_page.add_message("assistant", content)
+            if role == "assistant_cancelled":
+                logger.info("Generation stopped by the user")
             
             if self.current_db:
                 self.save_current_conversation()
         elif role == "assistant":
+            if self._streaming_bubble is not None:
+                self._streaming_bubble.finish()
+                self._streaming_bubble = None
             self.chat_page.add_message("assistant", content)
-            self.chat_page.enable_input(True)
         self.page.update()
             
     def handle_attach_file(self, e):
@@ -367,6 +470,8 @@ class RAGAssistant:
         pass
     
     def handle_new_chat(self):
+        if self._session:
+            self._session.cancel_generation(wait=True)
         self.save_current_conversation()
         
         if self._session:
@@ -379,19 +484,49 @@ class RAGAssistant:
     def handle_save_profile(self, display_username, bio):
         self.profile_page.show_success("Profile updated successfully!")
     
+    def stream_file_content(self, file_path):
+        """
+        Like extract_file_content, but PDFs are yielded page by page
+        """
+        if file_path.endswith('.pdf'):
+            key = text_extractor.cache_key(file_path)
+            cached = text_extractor.cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+            yield from text_extractor.cache.put_pieces(key, self._stream_pdf(file_path))
+        else:
+            yield self.extract_file_content(file_path)
+    
+    def _stream_pdf(self, file_path):
+        yield os.path.splitext(os.path.basename(file_path))[0] + "\n"
+        for _, text in (self._extractor or ParallelExtractor()).iter_pdf_pages(file_path):
+            yield text
+    
     def extract_file_content(self, file_path):
         try:
+            if file_path.endswith('.txt'):
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    return f.read()
+            # Parsed and OCR'd text is cached by file content, so attaching
+            # the same file again skips extraction.
+            key = text_extractor.cache_key(file_path)
+            cached = text_extractor.cache.get(key)
+            if cached is not None:
+                return cached
             if file_path.endswith('.pdf'):
-                return from_pdf(file_path)
+                text = (self._extractor or ParallelExtractor()).from_pdf(file_path)
             elif file_path.endswith('.docx'):
-                return from_docx(file_path)
+                text = from_docx(file_path)
             elif file_path.lower().endswith(('.png', '.jpg', '.jpeg')):
-                return from_image(file_path)
-            elif file_path.endswith('.txt'):
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    return f.read()
+                text = from_image(file_path)
             else:
                 return ""
+            text_extractor.cache.put(key, text)
+            return text
+        except ExtractionCancelled:
+            logger.info(f"Extraction of {file_path} cancelled")
+            return ""
         except Exception as e:
             logger.error(f"Error extracting file content: {e}")
             return ""
@@ -419,13 +554,14 @@ class RAGAssistant:
         if not self.current_db or not self._session:
             return
         
-        messages_to_save = self._session.messages.get_all()
+        messages_to_save = self._session.messages.get_unsaved()
         
         if not messages_to_save:
             return
     
         try:
             history.save(self.current_db, messages_to_save)
+            self._session.messages.mark_saved(len(messages_to_save))
             logger.info(f"Sauvegarde de {len(messages_to_save)} messages réussie.")
             
             self.chat_page.clear_history()
@@ -439,4 +575,6 @@ def main(page: ft.Page):
     app = RAGAssistant(page)
 
 if __name__ == "__main__":
+    # Extraction workers are spawned; a frozen build must not rerun the app in them.
+    multiprocessing.freeze_support()
     ft.app(target=main)
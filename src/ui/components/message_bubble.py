@@ -1,6 +1,11 @@
+import threading
+import time
 import flet as ft
 
 class MessageBubble(ft.Container):
+    # Minimum seconds between two redraws while a reply is streamed in.
+    FLUSH_INTERVAL = 0.05
+    
     def __init__(self, message: dict):
         super().__init__()
         self.role = message["role"]
@@ -10,7 +15,57 @@ class MessageBubble(ft.Container):
         self.border_radius = 15
         self.padding = 15
         self.margin = ft.margin.only(bottom=10)
+        self.text = ft.Text(self.content, selectable=True)
         self.content = ft.Column([
             ft.Text(self.role.title(), weight=ft.FontWeight.BOLD, size=12),
-            ft.Text(self.content, selectable=True)
+            self.text
         ], tight=True)
+        
+        self._buffer = []
+        self._last_flush = 0.0
+        self._flush_timer = None
+        self._lock = threading.Lock()
+    
+    def append(self, chunk: str):
+        """
+        Add streamed text; redraws are capped at one per FLUSH_INTERVAL and
+        text arriving in between is shown by a trailing flush
+        """
+        with self._lock:
+            self._buffer.append(chunk)
+            wait = self._last_flush + self.FLUSH_INTERVAL - time.monotonic()
+            if wait > 0:
+                if self._flush_timer is None:
+                    self._flush_timer = threading.Timer(wait, self.flush)
+                    self._flush_timer.daemon = True
+                    self._flush_timer.start()
+                return
+        self.flush()
+    
+    def flush(self):
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if not self._buffer:
+                return
+            self.text.value = (self.text.value or "") + "".join(self._buffer)
+            self._buffer = []
+            self._last_flush = time.monotonic()
+        if self.page:
+            self.update()
+    
+    def finish(self, text: str = None):
+        """
+        End the stream, replacing the streamed text with the full reply when given
+        """
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if text is None:
+                text = (self.text.value or "") + "".join(self._buffer)
+            self.text.value = text
+            self._buffer = []
+        if self.page:
+            self.update()
@@ -4,9 +4,11 @@ from tkinter import filedialog
 import os
 
 class MessageInput(ft.Container):
-    def __init__(self, on_send=None, on_attach=None, placeholder="Ask AI...", show_attach_button=True, **kwargs):
+    def __init__(self, on_send=None, on_attach=None, on_stop=None, placeholder="Ask AI...", show_attach_button=True, **kwargs):
         self.on_send = on_send
         self.on_attach = on_attach
+        self.on_stop = on_stop
+        self.generating = False
         self.placeholder = placeholder
         self.show_attach_button = show_attach_button
         
@@ -38,11 +40,12 @@ class MessageInput(ft.Container):
                 on_click=self._handle_attach_with_tkinter
             ))
             
-        buttons.append(ft.IconButton(
+        self.send_button = ft.IconButton(
             icon=ft.Icons.SEND_ROUNDED,
             icon_color=ft.Colors.BLUE_600,
-            on_click=lambda e: self._handle_send()
-        ))
+            on_click=lambda e: self._handle_send_or_stop()
+        )
+        buttons.append(self.send_button)
 
         input_row = ft.Row(
             controls=[
@@ -145,7 +148,16 @@ class MessageInput(ft.Container):
     def has_file(self):
         return self.attached_file_path is not None
     
+    def _handle_send_or_stop(self):
+        if self.generating:
+            if self.on_stop:
+                self.on_stop()
+        else:
+            self._handle_send()
+    
     def _handle_send(self):
+        if self.generating:
+            return
         message = self.text_field.value.strip()
         if message:
             self.on_send(message, self.attached_file_path)
@@ -165,6 +177,20 @@ class MessageInput(ft.Container):
                 control.disabled = disabled
         self.update()
     
+    def set_generating(self, generating=True):
+        """
+        While a reply is generated, input is locked and the send button becomes a stop button
+        """
+        self.generating = generating
+        self.text_field.disabled = generating
+        for control in self.content.controls[1].controls:
+            if isinstance(control, ft.IconButton):
+                control.disabled = generating and control is not self.send_button
+        self.send_button.icon = ft.Icons.STOP_ROUNDED if generating else ft.Icons.SEND_ROUNDED
+        self.send_button.icon_color = ft.Colors.RED_600 if generating else ft.Colors.BLUE_600
+        self.send_button.tooltip = "Stop generating" if generating else None
+        self.update()
+    
     def set_placeholder(self, placeholder):
         if not self.has_file():
             self.text_field.hint_text = placeholder
@@ -11,6 +11,7 @@ class ChatPage(ft.Container):
         # Callbacks externes
         self.on_send_message = None
         self.on_attach_file = None
+        self.on_stop_generation = None
         self.on_menu_click = None
         self.on_profile_click = None
         self.on_logout_click = None
@@ -49,6 +50,7 @@ class ChatPage(ft.Container):
         self.message_input = MessageInput(
             on_send=self._handle_send,
             on_attach=self._handle_attach,
+            on_stop=self._handle_stop,
             placeholder="Ask AI..."
         )
 
@@ -109,6 +111,10 @@ class ChatPage(ft.Container):
         if self.on_attach_file:
             self.on_attach_file(e)
 
+    def _handle_stop(self):
+        if self.on_stop_generation:
+            self.on_stop_generation()
+
     def _handle_select_chat(self, chat_id):
         self.current_chat_id = chat_id
         if self.on_load_chat:
@@ -131,6 +137,12 @@ class ChatPage(ft.Container):
     def add_message(self, role, content):
         self._add_message(role, content)
 
+    def add_streaming_message(self, role="assistant"):
+        from ..components.message_bubble import MessageBubble
+        bubble = MessageBubble({"role": role, "content": ""})
+        self.chat_history.controls.append(bubble)
+        return bubble
+
     def clear_messages(self):
         self.chat_history.controls.clear()
         
@@ -143,6 +155,7 @@ class ChatPage(ft.Container):
     def set_callbacks(self, callbacks):
         self.on_send_message = callbacks.get("on_send_message")
         self.on_attach_file = callbacks.get("on_attach_file")
+        self.on_stop_generation = callbacks.get("on_stop_generation")
         self.on_menu_click = callbacks.get("on_menu_click")
         self.on_profile_click = callbacks.get("on_profile_click")
         self.on_logout_click = callbacks.get("on_logout_click")
@@ -163,6 +176,9 @@ class ChatPage(ft.Container):
     def enable_input(self, enabled=True):
         self.message_input.disable(not enabled)
 
+    def set_generating(self, generating=True):
+        self.message_input.set_generating(generating)
+
     def reset(self):
         self.clear_user()
         self.clear_messages()